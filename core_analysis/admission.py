@@ -0,0 +1,94 @@
+"""
+admission.py
+Admission control for the analysis pipeline.
+
+Each request asks the controller whether it may run the full Node 1/2/3
+chain. It is sent down the cheap degraded path instead when:
+- `max_in_flight` full-path requests are already running, or
+- the moving average (EWMA) of full-path latency is over `latency_budget_ms`.
+
+While over budget, one request per PROBE_INTERVAL still takes the full path,
+so the average keeps tracking the real cost and the controller recovers once
+the load drops. The first full-path request is not averaged, since it pays
+the one-off cost of loading the models. A limit or budget of 0 disables that
+check.
+
+Usage:
+    with controller.admit() as ticket:
+        if ticket.degraded:
+            ...cheap path...
+        else:
+            ...full path...
+"""
+
+import threading
+import time
+
+from core_analysis.metrics import counter
+
+EWMA_ALPHA = 0.2
+PROBE_INTERVAL = 1.0  # seconds between full-path probes while over budget
+
+ADMISSIONS = counter('admission_decisions_total', 'Analyze requests by admission decision', ('path', 'reason'))
+
+
+class _Ticket:
+    __slots__ = ('controller', 'degraded', 'reason', 'start')
+
+    def __init__(self, controller, degraded, reason):
+        self.controller = controller
+        self.degraded = degraded
+        self.reason = reason
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.degraded:
+            self.controller._release((time.perf_counter() - self.start) * 1000.0, exc_type is None)
+        return False
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight=0, latency_budget_ms=0.0):
+        self.max_in_flight = max_in_flight
+        self.latency_budget_ms = latency_budget_ms
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.latency_ewma_ms = None
+        self._last_probe = 0.0
+        self._cold = True
+
+    def admit(self):
+        """Decides the path for one request; use the returned ticket as a context manager."""
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                reason = 'in_flight'
+            elif (self.latency_budget_ms and self.latency_ewma_ms is not None
+                  and self.latency_ewma_ms > self.latency_budget_ms):
+                now = time.monotonic()
+                if now - self._last_probe >= PROBE_INTERVAL:
+                    self._last_probe = now
+                    reason = 'probe'
+                else:
+                    reason = 'latency'
+            else:
+                reason = 'ok'
+            degraded = reason in ('in_flight', 'latency')
+            if not degraded:
+                self.in_flight += 1
+        ADMISSIONS.inc(labels=('degraded' if degraded else 'full', reason))
+        return _Ticket(self, degraded, reason)
+
+    def _release(self, latency_ms, succeeded):
+        with self._lock:
+            self.in_flight -= 1
+            if self._cold:
+                self._cold = False
+            elif succeeded:
+                if self.latency_ewma_ms is None:
+                    self.latency_ewma_ms = latency_ms
+                else:
+                    self.latency_ewma_ms += EWMA_ALPHA * (latency_ms - self.latency_ewma_ms)
@@ -6,14 +6,24 @@ It provides functions to analyze chat messages and persist them with sentiment d
 """
 import sys
 import os
+import threading
+from datetime import datetime
 
 # Add parent directory to path to find other modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from ui_io.storage import append_message, append_messages, get_history, get_csv_path, get_all_messages_for_analysis
-from core_analysis.node_1 import analyze_sentiment_node_1
+from ui_io.storage import (append_message, append_messages, append_rows, get_history, get_csv_path,
+                           get_all_messages_for_analysis, has_message_ids, sync_messages)
+from core_analysis.node_1 import analyze_sentiment_node_1, warm_up as warm_up_node_1
 from core_analysis.node_2 import run_node_2_analysis
-from core_analysis.node_3 import run_core_analysis
+from core_analysis.node_3 import run_core_analysis, get_insight_engine, score_message
+from core_analysis.lexicon import get_lexicon
+from core_analysis.profiling import span
+from core_analysis.metrics import histogram, gauge
+from core_analysis.trend import get_trend_tracker
+from core_analysis.events import get_broker
+from core_analysis.coalescer import RequestCoalescer
+from core_analysis.admission import AdmissionController
 
 __all__ = [
     "append_message", 
@@ -22,10 +32,49 @@ __all__ = [
     "get_csv_path",
     "get_all_messages_for_analysis",
     "process_user_message",
+    "process_user_messages",
+    "submit_user_message",
+    "process_user_message_degraded",
+    "sync_client_messages",
     "predict_next_sentiment",
-    "get_last_sentiment_from_history"
+    "get_last_sentiment_from_history",
+    "warm_up"
 ]
 
+CSV_APPEND_SECONDS = histogram('csv_append_seconds', 'Latency of appending a message to the history CSV')
+
+# Request coalescing for submit_user_message (0 = off: every call is processed on its own)
+BATCH_WINDOW_MS = float(os.environ.get('SENTIMENT_BATCH_WINDOW_MS', '0'))
+BATCH_MAX_SIZE = int(os.environ.get('SENTIMENT_BATCH_MAX', '64'))
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+# Admission control for submit_user_message (0 = no limit / no budget). With
+# batching on, the default leaves room for one batch filling while another
+# runs; batches are capped at the in-flight limit so a full batch can form.
+admission = AdmissionController(
+    max_in_flight=int(os.environ.get('SENTIMENT_MAX_IN_FLIGHT',
+                                     str(2 * BATCH_MAX_SIZE if BATCH_WINDOW_MS > 0 else 32))),
+    latency_budget_ms=float(os.environ.get('SENTIMENT_LATENCY_BUDGET_MS', '0'))
+)
+gauge('analyze_in_flight', 'Analyze requests running the full pipeline', lambda: admission.in_flight)
+gauge('analyze_latency_ewma_seconds', 'Moving average of full-pipeline latency',
+      lambda: admission.latency_ewma_ms / 1000.0 if admission.latency_ewma_ms is not None else None)
+
+
+def warm_up():
+    """
+    Loads the lazily-initialized analysis state ahead of traffic: the Node 3
+    lexicons and insight store, the trend state and Node 1 (TextBlob).
+    
+    Call it once before forking workers (e.g. gunicorn --preload) so every
+    worker starts with this state already in memory.
+    """
+    get_lexicon()
+    get_insight_engine()
+    get_trend_tracker().preload()
+    warm_up_node_1()
+
 
 def get_last_sentiment_from_history(contact_id: str):
     """
@@ -49,7 +98,7 @@ def predict_next_sentiment(current_sentiment: str):
     return result.get('prediction'), result.get('probability')
 
 
-def process_user_message(text: str, contact: dict) -> dict:
+def process_user_message(text: str, contact: dict, client_id: str = None, message_id: str = None) -> dict:
     """
     Process a user message by analyzing sentiment and formatting for display.
     Uses the Node 1, 2, 3 Architecture.
@@ -57,28 +106,286 @@ def process_user_message(text: str, contact: dict) -> dict:
     Args:
         text (str): The user's message text
         contact (dict): Contact information with 'id' and 'name'
+        client_id (str): Optional id of the sending client (e.g. browser tab),
+            echoed in the published event so it can skip its own messages
+        message_id (str): Optional client-side id of the message, also echoed
         
     Returns:
         dict: Processed message with sentiment analysis and display formatting
     """
+    # Load the trend state before this message is stored, so a first-time
+    # bootstrap from the CSV does not count it twice
+    get_trend_tracker().preload()
+    
     # 1. Get History
     csv_path = get_csv_path()
-    history_messages = get_all_messages_for_analysis()
-    
-    # Get last sentiment for Node 2 prediction context
-    last_sentiment = get_last_sentiment_from_history(contact.get('id', 'unknown'))
+    with span('history_read'):
+        history_messages = get_all_messages_for_analysis()
+        
+        # Get last sentiment for Node 2 prediction context
+        last_sentiment = get_last_sentiment_from_history(contact.get('id', 'unknown'))
     if not last_sentiment:
         last_sentiment = 'Neutral'
         
     # 2. Run Node 2 (Prediction)
-    node_2_result = run_node_2_analysis(csv_path, last_sentiment)
+    with span('node_2'):
+        node_2_result = run_node_2_analysis(csv_path, last_sentiment)
     
-    # 3. Run Node 1 (Placeholder)
-    node_1_result = analyze_sentiment_node_1(text)
+    # 3. Run Node 1 (TextBlob)
+    with span('node_1'):
+        node_1_result = analyze_sentiment_node_1(text)
     
     # 4. Run Node 3 (Core Analysis)
-    final_result = run_core_analysis(text, node_1_result, node_2_result, history_messages)
+    with span('node_3'):
+        final_result = run_core_analysis(text, node_1_result, node_2_result, history_messages)
+    
+    sentiment_analysis = _display_sentiment(final_result)
+    message_data = _message_record(text, sentiment_analysis, message_id)
+    
+    # Store in CSV
+    with span('csv_append'), CSV_APPEND_SECONDS.time():
+        append_message(contact, message_data)
+    
+    return _finish_message(contact, text, final_result, sentiment_analysis, message_data, client_id, message_id)
+
+
+def process_user_messages(requests: list, return_exceptions: bool = False) -> list:
+    """
+    Processes a batch of user messages in one pass, with the same results as
+    calling process_user_message for each in order.
+    
+    The batch shares one history read and one Node 2 model lookup, records
+    all insights in memory and saves the insight store once, and appends
+    every message to the CSV in a single write.
+
+    The batch is not atomic: each message's interaction is recorded in the
+    in-memory insight store as it is scored. If the insight save or the CSV
+    append then raises, the error reaches every caller, but the recorded
+    interactions stay (and are saved with the next save), and after a CSV
+    failure the insight store has been written for messages that were not
+    stored.
+
+    Args:
+        requests (list): dicts with 'text', 'contact' and optional
+            'client_id' / 'message_id' (see process_user_message)
+        return_exceptions (bool): if a message fails to analyze, put the
+            exception in its result slot and store the others, instead of
+            raising before anything is stored
+        
+    Returns:
+        list: process_user_message results, in request order
+    """
+    if not requests:
+        return []
+    get_trend_tracker().preload()
+    csv_path = get_csv_path()
+    with span('history_read'):
+        history_messages = get_all_messages_for_analysis()
+    
+    # Last stored sentiment per contact, advanced as the batch is scored so
+    # later messages see earlier ones, as they would one at a time
+    last_sentiments = {}
+    analyzed = []
+    for req in requests:
+        try:
+            text = req['text']
+            contact_id = req['contact'].get('id', 'unknown')
+            if contact_id not in last_sentiments:
+                with span('history_read'):
+                    last_sentiments[contact_id] = get_last_sentiment_from_history(contact_id) or 'Neutral'
+            
+            with span('node_2'):
+                node_2_result = run_node_2_analysis(csv_path, last_sentiments[contact_id])
+            with span('node_1'):
+                node_1_result = analyze_sentiment_node_1(text)
+            with span('node_3'):
+                final_result = run_core_analysis(text, node_1_result, node_2_result, history_messages, save=False)
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            analyzed.append(e)
+            continue
+        
+        last_sentiments[contact_id] = final_result['category']
+        sentiment_analysis = _display_sentiment(final_result)
+        analyzed.append((req, final_result, sentiment_analysis,
+                         _message_record(text, sentiment_analysis, req.get('message_id'))))
+    
+    stored = [entry for entry in analyzed if not isinstance(entry, Exception)]
+    
+    # One insight-store write and one CSV write for the whole batch
+    with span('insights_save'):
+        get_insight_engine().save()
+    if stored:
+        with span('csv_append'), CSV_APPEND_SECONDS.time():
+            append_rows([(req['contact'], message_data) for req, _, _, message_data in stored])
+    
+    return [
+        entry if isinstance(entry, Exception) else
+        _finish_message(entry[0]['contact'], entry[0]['text'], entry[1], entry[2], entry[3],
+                        entry[0].get('client_id'), entry[0].get('message_id'))
+        for entry in analyzed
+    ]
+
+
+def process_user_message_degraded(text: str, contact: dict, client_id: str = None, message_id: str = None) -> dict:
+    """
+    Cheap fallback for process_user_message when the server is overloaded:
+    context-only Node 3 scoring, no history read, no Node 2 or Node 1, and
+    the insight store neither consulted nor updated. The message is still stored, its
+    trend updated and subscribers notified. The result has 'degraded': True.
+    """
+    get_trend_tracker().preload()
+    with span('node_3'):
+        final_result = score_message(text, None, None, use_insights=False)
+    sentiment_analysis = _display_sentiment(final_result)
+    message_data = _message_record(text, sentiment_analysis, message_id)
+    with span('csv_append'), CSV_APPEND_SECONDS.time():
+        append_message(contact, message_data)
+    result = _finish_message(contact, text, final_result, sentiment_analysis, message_data, client_id, message_id)
+    result['degraded'] = True
+    return result
+
+
+def submit_user_message(text: str, contact: dict, client_id: str = None, message_id: str = None) -> dict:
+    """
+    Entry point for the web servers. Same as process_user_message, except:
+    - the admission controller may route the call to
+      process_user_message_degraded when too many requests are in flight
+      (SENTIMENT_MAX_IN_FLIGHT) or full-pipeline latency is over budget
+      (SENTIMENT_LATENCY_BUDGET_MS);
+    - when SENTIMENT_BATCH_WINDOW_MS > 0, concurrent calls arriving within
+      that window are processed together by process_user_messages.
+    """
+    with admission.admit() as ticket:
+        if ticket.degraded:
+            return process_user_message_degraded(text, contact, client_id=client_id, message_id=message_id)
+        if BATCH_WINDOW_MS <= 0:
+            return process_user_message(text, contact, client_id=client_id, message_id=message_id)
+        return _get_coalescer().submit({
+            'text': text, 'contact': contact, 'client_id': client_id, 'message_id': message_id
+        })
+
+
+def _client_record(message):
+    """Maps a message from the browser's local history to a storage record."""
+    sentiment = message.get('sentiment') or {}
+    return {
+        'message_id': str(message['id']),
+        'dir': 'received' if message.get('dir') == 'received' else 'sent',
+        'iso': message.get('iso'),
+        'date': message.get('date'),
+        'time': message.get('time'),
+        'text': message['text'],
+        'sentiment_polarity': sentiment.get('polarity'),
+        'sentiment_category': sentiment.get('category'),
+        'sentiment_emoji': sentiment.get('emoji'),
+        'color_hex': sentiment.get('color')
+    }
+
+
+def sync_client_messages(contact: dict, messages: list, since: int = 0, client_id: str = None) -> dict:
+    """
+    Reconciles a client's local history with the server in one call.
+    
+    Messages the server has not seen (by message id) are stored in one
+    write; ids already stored, e.g. by an earlier /api/analyze call or a
+    retried sync, are skipped. Sent messages that were never analyzed (the
+    client was offline) are scored first, with Node 1 and context-only
+    Node 3 (no Node 2 and no insight tracking, as they are not live input).
+    Newly stored messages update the trend and are published to other
+    subscribers of the contact.
+    
+    Args:
+        contact (dict): 'id' and 'name'
+        messages (list): client messages with 'id', 'text' and optional
+            'dir', 'iso', 'date', 'time' and 'sentiment'
+        since (int): the client's history cursor from its last sync
+        client_id (str): echoed in published events
+        
+    Returns:
+        dict: 'stored' and 'duplicates' (message ids), 'sentiments' (id ->
+        sentiment for messages scored here), 'messages' (server messages
+        after `since` the client did not send) and the new 'cursor'
+    """
+    records = [_client_record(m) for m in messages if m.get('id') and m.get('text')]
+    known = has_message_ids([r['message_id'] for r in records])
+    
+    sentiments = {}
+    scores = {}
+    for record in records:
+        if record['message_id'] in known or record['dir'] != 'sent':
+            continue
+        try:
+            polarity = float(record['sentiment_polarity'])
+        except (TypeError, ValueError):
+            polarity = None
+        if record['sentiment_category'] and polarity is not None:
+            record['sentiment_polarity'] = polarity
+            scores[record['message_id']] = polarity
+            continue
+        with span('node_1'):
+            node_1_result = analyze_sentiment_node_1(record['text'])
+        with span('node_3'):
+            final_result = score_message(record['text'], node_1_result, None)
+        sentiment = _display_sentiment(final_result)
+        record.update({
+            'sentiment_polarity': sentiment['polarity_score'],
+            'sentiment_category': sentiment['category'],
+            'sentiment_emoji': sentiment['emoji'],
+            'color_hex': sentiment['color']
+        })
+        sentiments[record['message_id']] = sentiment
+        scores[record['message_id']] = sentiment['polarity_score']
     
+    get_trend_tracker().preload()
+    with span('csv_append'), CSV_APPEND_SECONDS.time():
+        stored, newer, cursor = sync_messages(contact, records, since)
+    
+    contact_id = contact.get('id', 'unknown')
+    broker = get_broker()
+    for record in stored:
+        trend = None
+        if record['message_id'] in scores:
+            trend = get_trend_tracker().update(contact_id, scores[record['message_id']])
+        broker.publish(contact_id, {
+            'client_id': client_id,
+            'message_id': record['message_id'],
+            'message': record,
+            'sentiment': {
+                'polarity_score': record['sentiment_polarity'],
+                'category': record['sentiment_category'],
+                'emoji': record['sentiment_emoji'],
+                'color': record['color_hex'],
+                'description': sentiments.get(record['message_id'], {}).get('description')
+            },
+            'trend': trend
+        })
+    
+    stored_ids = [record['message_id'] for record in stored]
+    return {
+        'stored': stored_ids,
+        'duplicates': [r['message_id'] for r in records if r['message_id'] not in stored_ids],
+        'sentiments': {k: v for k, v in sentiments.items() if k in stored_ids},
+        'messages': newer,
+        'cursor': cursor
+    }
+
+
+def _get_coalescer():
+    global _coalescer
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = RequestCoalescer(
+                    lambda requests: process_user_messages(requests, return_exceptions=True),
+                    window_ms=BATCH_WINDOW_MS,
+                    max_batch=min(BATCH_MAX_SIZE, admission.max_in_flight or BATCH_MAX_SIZE)
+                )
+    return _coalescer
+
+
+def _display_sentiment(final_result):
     # Format for display/storage
     # Mapping Node 3 result to expected format
     sentiment_analysis = {
@@ -103,12 +410,14 @@ def process_user_message(text: str, contact: dict) -> dict:
     
     sentiment_analysis['emoji'] = emoji_map.get(final_result['category'], '😐')
     sentiment_analysis['color'] = hex_map.get(final_result['category'], '#9E9E9E')
-    
-    
+    return sentiment_analysis
+
+
+def _message_record(text, sentiment_analysis, message_id=None):
     # Prepare message for storage
-    from datetime import datetime
     now = datetime.now()
-    message_data = {
+    return {
+        'message_id': message_id,
         'dir': 'sent',
         'iso': now.isoformat(),
         'date': now.strftime('%Y-%m-%d'),
@@ -119,9 +428,21 @@ def process_user_message(text: str, contact: dict) -> dict:
         'sentiment_emoji': sentiment_analysis['emoji'],
         'color_hex': sentiment_analysis['color']
     }
+
+
+def _finish_message(contact, text, final_result, sentiment_analysis, message_data, client_id, message_id):
+    """Updates the trend and notifies subscribers for a stored message; returns the result dict."""
+    # Update the contact's running trend (no history re-read)
+    trend = get_trend_tracker().update(contact.get('id', 'unknown'), final_result['composite_score'])
     
-    # Store in CSV
-    append_message(contact, message_data)
+    # Push to live subscribers of this contact (e.g. other open tabs)
+    get_broker().publish(contact.get('id', 'unknown'), {
+        'client_id': client_id,
+        'message_id': message_id,
+        'message': message_data,
+        'sentiment': sentiment_analysis,
+        'trend': trend
+    })
     
     # Display Data for UI
     display_data = {
@@ -132,6 +453,7 @@ def process_user_message(text: str, contact: dict) -> dict:
     return {
         'message': display_data,
         'sentiment': sentiment_analysis,
-        'trend': 'stable', # Simplified for now
-        'stored': True
+        'trend': trend,
+        'stored': True,
+        'degraded': False
     }
@@ -0,0 +1,108 @@
+"""
+coalescer.py
+Micro-batching of concurrent requests.
+
+Callers submit one item and block for its result. A single worker thread
+collects items that arrive within `window_ms` of the first one (or until
+`max_batch` are waiting), processes them with one `process_batch(items)` call,
+and hands each caller its own result. Batches run one at a time, so the next
+batch fills while the current one is processed.
+
+`process_batch` may return an exception instance in place of a result; that
+caller then gets the exception raised. If process_batch itself raises, every
+caller in the batch gets that exception (whatever process_batch had already
+applied before raising stays applied), and a result list of the wrong length
+fails the callers left without a result. A worker that dies is replaced on
+the next submit, and callers wait at most `timeout` seconds.
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+from core_analysis.metrics import histogram
+
+BATCH_SIZE = histogram('coalescer_batch_size', 'Items processed per coalesced batch',
+                       buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+BATCH_WAIT_SECONDS = histogram('coalescer_wait_seconds', 'Time items waited before their batch started')
+
+DEFAULT_TIMEOUT = 60.0  # seconds a caller waits for its result
+
+
+class RequestCoalescer:
+    def __init__(self, process_batch, window_ms=5.0, max_batch=64):
+        """
+        Args:
+            process_batch: callable taking a list of items and returning a
+                list of results in the same order
+            window_ms: how long to wait for more items after the first arrives
+            max_batch: largest batch; a full batch starts immediately
+        """
+        self.process_batch = process_batch
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._cond = threading.Condition()
+        self._pending = []  # (item, future, submitted_at)
+        self._worker = None
+
+    def submit(self, item, timeout=DEFAULT_TIMEOUT):
+        """
+        Queues an item and waits for its result (re-raising its exception).
+        Raises concurrent.futures.TimeoutError after `timeout` seconds (None
+        waits forever).
+        """
+        future = Future()
+        with self._cond:
+            self._pending.append((item, future, time.perf_counter()))
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='request-coalescer', daemon=True)
+                self._worker.start()
+            self._cond.notify()
+        return future.result(timeout)
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = self._pending[0][2] + self.window
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._process(batch)
+            except BaseException as e:
+                # Nothing may be left waiting on a worker that is about to exit
+                for _item, future, _submitted in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                raise
+
+    def _process(self, batch):
+        started = time.perf_counter()
+        BATCH_SIZE.observe(len(batch))
+        for _item, _future, submitted_at in batch:
+            BATCH_WAIT_SECONDS.observe(started - submitted_at)
+        try:
+            results = list(self.process_batch([item for item, _, _ in batch]))
+        except Exception as e:
+            for _item, future, _submitted in batch:
+                future.set_exception(e)
+            return
+        for (_item, future, _submitted), result in zip(batch, results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        if len(results) != len(batch):
+            error = RuntimeError(f'process_batch returned {len(results)} results for {len(batch)} items')
+            for _item, future, _submitted in batch[len(results):]:
+                future.set_exception(error)
@@ -0,0 +1,113 @@
+"""
+events.py
+In-process publish/subscribe for newly stored chat messages.
+
+process_user_message publishes every stored message (with its sentiment) to
+the subscribers of that contact; the UI server streams them to browsers as
+Server-Sent Events. Each subscriber has its own bounded queue: a slow reader
+only loses its own oldest events (counted in `dropped`) and never blocks the
+publisher or other subscribers.
+
+Subscriptions can be consumed from a thread (get) or from an event loop by
+passing a `notify` callback that wakes the loop, then calling drain().
+"""
+
+import itertools
+import threading
+from collections import deque
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Subscription:
+    def __init__(self, broker, contact_id, maxsize=SUBSCRIBER_QUEUE_SIZE, notify=None):
+        self.broker = broker
+        self.contact_id = contact_id
+        self.dropped = 0
+        self.closed = False
+        self._queue = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._notify = notify
+
+    def put(self, event):
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(event)
+            self._cond.notify()
+        if self._notify is not None:
+            self._notify()
+
+    def get(self, timeout=None):
+        """Returns the next event, or None on timeout or once closed."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._queue or self.closed, timeout)
+            return self._queue.popleft() if self._queue else None
+
+    def drain(self):
+        """Returns all queued events without waiting."""
+        with self._cond:
+            events = list(self._queue)
+            self._queue.clear()
+            return events
+
+    def close(self):
+        self.broker.unsubscribe(self)
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        if self._notify is not None:
+            self._notify()
+
+
+class MessageBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # contact_id -> set of Subscription
+        self._sequence = itertools.count(1)
+
+    def subscribe(self, contact_id, maxsize=SUBSCRIBER_QUEUE_SIZE, notify=None):
+        subscription = Subscription(self, str(contact_id), maxsize, notify)
+        with self._lock:
+            self._subscribers.setdefault(subscription.contact_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.contact_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.contact_id]
+
+    def publish(self, contact_id, event):
+        """
+        Queues the event for every subscriber of contact_id, tagged with a
+        broker-wide increasing 'id'.
+
+        Returns:
+            int: number of subscribers it was delivered to
+        """
+        contact_id = str(contact_id)
+        with self._lock:
+            subscribers = list(self._subscribers.get(contact_id, ()))
+            if not subscribers:
+                return 0
+            event = dict(event, id=next(self._sequence), contact_id=contact_id)
+        for subscription in subscribers:
+            subscription.put(event)
+        return len(subscribers)
+
+    def subscriber_count(self, contact_id=None):
+        with self._lock:
+            if contact_id is None:
+                return sum(len(s) for s in self._subscribers.values())
+            return len(self._subscribers.get(str(contact_id), ()))
+
+
+_broker = MessageBroker()
+
+
+def get_broker():
+    """Returns the process-wide MessageBroker."""
+    return _broker
@@ -0,0 +1,143 @@
+"""
+lexicon.py
+Lexicon loader for the Node 3 context analysis.
+
+The positive, negative, interjection and sarcasm phrase lists live in
+data/lexicons.json instead of being hard-coded in node_3.py. The file is
+compiled once into frozensets plus a character trie, so a message is scanned
+a single time no matter how many phrases the lexicon holds.
+
+The file is re-checked (at most every LEXICON_CHECK_INTERVAL seconds) and a
+changed file is compiled and swapped in as a whole, so lexicon tuning takes
+effect on a running server without a restart.
+"""
+
+import json
+import os
+import threading
+import time
+
+LEXICON_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'lexicons.json')
+LEXICON_CHECK_INTERVAL = 2.0
+
+CATEGORIES = ('positive_words', 'negative_words', 'interjection_negatives', 'sarcasm_indicators')
+
+# Trie key marking the end of a phrase (characters are never the empty string)
+_END = ''
+
+
+class CompiledLexicon:
+    """
+    An immutable, compiled snapshot of the lexicon file.
+    Never mutated after construction, so readers need no locking.
+    """
+    def __init__(self, data):
+        self.version = data.get('version', 0)
+        self.positive_words = frozenset(w.lower() for w in data.get('positive_words', []))
+        self.negative_words = frozenset(w.lower() for w in data.get('negative_words', []))
+        self.interjection_negatives = frozenset(w.lower() for w in data.get('interjection_negatives', []))
+        self.sarcasm_indicators = frozenset(w.lower() for w in data.get('sarcasm_indicators', []))
+
+        self._trie = {}
+        phrases = (self.positive_words | self.negative_words
+                   | self.interjection_negatives | self.sarcasm_indicators)
+        for phrase in phrases:
+            if not phrase:
+                continue
+            node = self._trie
+            for ch in phrase:
+                node = node.setdefault(ch, {})
+            node[_END] = phrase
+
+    def find_phrases(self, text_lower):
+        """
+        Returns the set of lexicon phrases occurring anywhere in the text
+        (substring semantics, same as `phrase in text_lower`).
+        """
+        found = set()
+        trie = self._trie
+        n = len(text_lower)
+        for i in range(n):
+            node = trie.get(text_lower[i])
+            j = i + 1
+            while node is not None:
+                phrase = node.get(_END)
+                if phrase is not None:
+                    found.add(phrase)
+                if j >= n:
+                    break
+                node = node.get(text_lower[j])
+                j += 1
+        return found
+
+
+class LexiconStore:
+    """
+    Holds the current CompiledLexicon and swaps in a new one when the
+    backing file changes on disk.
+    """
+    def __init__(self, path=LEXICON_PATH, check_interval=LEXICON_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._lexicon = None
+        self._mtime = None
+        self._next_check = 0.0
+
+    def get(self):
+        now = time.monotonic()
+        if self._lexicon is None or now >= self._next_check:
+            self._check(now)
+        return self._lexicon
+
+    def _check(self, now):
+        with self._lock:
+            if self._lexicon is not None and now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if self._lexicon is not None and mtime == self._mtime:
+                return
+            self._load(mtime)
+
+    def reload(self):
+        """Forces a re-read of the lexicon file."""
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                mtime = None
+            self._load(mtime)
+        return self._lexicon
+
+    def _load(self, mtime):
+        # Caller holds self._lock
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                compiled = CompiledLexicon(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not load lexicon file {self.path}: {e}")
+            if self._lexicon is None:
+                self._lexicon = CompiledLexicon({})
+            # Remember the broken mtime so we don't retry until the file changes again
+            self._mtime = mtime
+            return
+        # Single reference assignment: readers see either the old or the new lexicon
+        self._lexicon = compiled
+        self._mtime = mtime
+
+
+_store = LexiconStore()
+
+
+def get_lexicon():
+    """Returns the current compiled lexicon, reloading it if the file changed."""
+    return _store.get()
+
+
+def reload_lexicons():
+    """Forces the lexicon file to be re-read immediately."""
+    return _store.reload()
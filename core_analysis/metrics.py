@@ -0,0 +1,236 @@
+"""
+metrics.py
+Process-wide counters, histograms and gauges in the Prometheus text format.
+
+Usage:
+    from core_analysis.metrics import counter, histogram
+
+    REQUESTS = counter('http_requests_total', 'HTTP requests', ('route', 'status'))
+    REQUESTS.inc(labels=('/api/analyze', '200'))
+
+    LATENCY = histogram('csv_append_seconds', 'CSV append latency')
+    with LATENCY.time():
+        append_message(...)
+
+    render()  # -> text for a /metrics endpoint
+
+Writes never take a lock: every thread updates its own shard (a plain dict
+only that thread mutates), and render() sums the shards. Shards of threads
+that have exited are folded into a shared total when metrics are rendered,
+so per-request threads do not accumulate.
+"""
+
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = {}          # name -> metric, in registration order
+_registry_lock = threading.Lock()
+_shards = []            # (weakref to thread, shard dict) per live thread
+_shards_lock = threading.Lock()
+_retired = {}           # merged values of shards whose thread has exited
+_local = threading.local()
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append((weakref.ref(threading.current_thread()), shard))
+        return shard
+
+
+def _merge(into, key, value):
+    if isinstance(value, list):
+        slot = into.get(key)
+        if slot is None:
+            into[key] = list(value)
+        else:
+            for i, v in enumerate(value):
+                slot[i] += v
+    else:
+        into[key] = into.get(key, 0) + value
+
+
+def _collect():
+    """Returns key -> summed value over all shards."""
+    with _shards_lock:
+        live = []
+        for ref, shard in _shards:
+            thread = ref()
+            if thread is None or not thread.is_alive():
+                # No more writes can happen to this shard
+                for key, value in shard.items():
+                    _merge(_retired, key, value)
+            else:
+                live.append((ref, shard))
+        _shards[:] = live
+        totals = {}
+        for key, value in _retired.items():
+            _merge(totals, key, value)
+    for _ref, shard in live:
+        for key, value in list(shard.items()):
+            _merge(totals, key, list(value) if isinstance(value, list) else value)
+    return totals
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, amount=1, labels=()):
+        shard = _shard()
+        key = (self.name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        shard = _shard()
+        key = (self.name, labels)
+        slot = shard.get(key)
+        if slot is None:
+            # One count per bucket, then +Inf, sum, count
+            slot = shard[key] = [0] * (len(self.buckets) + 3)
+        slot[bisect_left(self.buckets, value)] += 1
+        slot[-2] += value
+        slot[-1] += 1
+
+    def time(self, labels=()):
+        """Returns a context manager observing the enclosed block's duration in seconds."""
+        return _Timer(self, labels)
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, self.labels)
+        return False
+
+
+class Gauge:
+    """A value computed at scrape time by calling `func` (None skips the sample)."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, func):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = ()
+        self.func = func
+
+
+def _register(metric):
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            if existing.kind != metric.kind:
+                raise ValueError(f"Metric '{metric.name}' is already registered as a {existing.kind}")
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def gauge(name, documentation, func):
+    return _register(Gauge(name, documentation, func))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value) if value == value else 'NaN'
+    return str(value)
+
+
+def render():
+    """Returns all metrics in the Prometheus text exposition format (0.0.4)."""
+    totals = _collect()
+    by_metric = {}
+    for (name, labels), value in totals.items():
+        by_metric.setdefault(name, []).append((labels, value))
+    with _registry_lock:
+        metrics = list(_registry.values())
+
+    lines = []
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        if metric.kind == 'gauge':
+            try:
+                value = metric.func()
+            except Exception:
+                value = None
+            if value is not None:
+                lines.append(f'{metric.name} {_format_value(value)}')
+            continue
+        for labels, value in sorted(by_metric.get(metric.name, ()), key=lambda item: item[0]):
+            if metric.kind == 'counter':
+                lines.append(f'{metric.name}{_format_labels(metric.labelnames, labels)} {_format_value(value)}')
+                continue
+            cumulative = 0
+            bounds = [repr(float(b)) for b in metric.buckets] + ['+Inf']
+            for bound, count in zip(bounds, value[:-2]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{metric.name}_bucket{_format_labels(metric.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{metric.name}_sum{_format_labels(metric.labelnames, labels)} {_format_value(value[-2])}')
+            lines.append(f'{metric.name}_count{_format_labels(metric.labelnames, labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """
+    Clears all recorded values (registered metrics are kept).
+
+    Test-only: call it while no other thread is recording. Shards are
+    written by their threads without a lock, so clearing one mid-update can
+    lose or corrupt that update.
+    """
+    with _shards_lock:
+        for _ref, shard in _shards:
+            shard.clear()
+        _retired.clear()
@@ -2,37 +2,64 @@
 node_1.py
 TextBlob-based Sentiment Analysis Node.
 
-This file is currently a placeholder for future integration of TextBlob analysis.
-It will eventually contain logic to analyze text polarity and subjectivity using the TextBlob library.
+Analyzes text polarity and subjectivity using the TextBlob library and hands
+the result to Node 3, which weighs it at 0.6 against the context score.
+
+TextBlob is imported lazily (see sentiment_analyzer._get_textblob) on the first
+analysis, or ahead of time by calling warm_up() at server start. Scores go
+through the shared polarity cache (sentiment_analyzer.cached_emotion), so
+repeated messages skip TextBlob entirely.
+
+Set SENTIMENT_NODE1=0 to disable this node; Node 3 then falls back to the
+context-only score. The node also disables itself if TextBlob is not installed.
 
 Connection Points:
 - The 'analyze_sentiment_node_1' function is the main entry point.
-- It should return a dictionary with 'polarity', 'subjectivity', and 'classification'.
+- It returns a dictionary with 'polarity', 'subjectivity', and 'classification'.
 """
 
-# CONNECTION POINT FOR FUTURE CODE: Import TextBlob
-# from textblob import TextBlob
+import os
+
+from core_analysis.sentiment_analyzer import cached_emotion, get_sentiment_category
+
+NODE_1_ENABLED = os.environ.get('SENTIMENT_NODE1', '1') != '0'
+
 
 def analyze_sentiment_node_1(text):
     """
-    Placeholder for TextBlob sentiment analysis.
-    
+    TextBlob sentiment analysis.
+
     Args:
         text (str): The input text to analyze.
-        
+
+    Returns:
+        dict or None: {'polarity', 'subjectivity', 'classification', 'source'},
+                      or None when the node is disabled or TextBlob is unavailable.
+    """
+    global NODE_1_ENABLED
+    if not NODE_1_ENABLED or not text:
+        return None
+
+    try:
+        polarity, subjectivity = cached_emotion(text)
+    except ImportError as e:
+        print(f"Warning: Node 1 disabled, TextBlob is not available ({e})")
+        NODE_1_ENABLED = False
+        return None
+
+    return {
+        'polarity': polarity,
+        'subjectivity': subjectivity,
+        'classification': get_sentiment_category(polarity)['category'],
+        'source': 'node_1'
+    }
+
+
+def warm_up():
+    """
+    Imports TextBlob and loads its lexicon now rather than on the first request.
+
     Returns:
-        dict or None: Currently returns None to indicate this node is inactive.
-                      In the future, it will return sentiment scores.
+        bool: True if Node 1 is active and ready.
     """
-    # CONNECTION POINT FOR FUTURE CODE: Implement analysis logic
-    # blob = TextBlob(text)
-    # return {
-    #     'polarity': blob.sentiment.polarity,
-    #     'subjectivity': blob.sentiment.subjectivity,
-    #     'source': 'node_1'
-    # }
-    
-    # Current behavior: Bypass
-    return None
-
-# CONNECTION POINT FOR FUTURE CODE: Helper functions for TextBlob
+    return analyze_sentiment_node_1("warm up") is not None
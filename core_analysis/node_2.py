@@ -8,8 +8,14 @@ and predicts the next possible sentiment based on patterns (Markov Chain approac
 
 import csv
 import os
+import threading
 from collections import defaultdict
 
+from core_analysis.metrics import counter
+
+NODE_2_TRAINS = counter('node2_model_trains_total', 'Node 2 models trained from CSV')
+NODE_2_CACHE_HITS = counter('node2_model_cache_hits_total', 'Node 2 predictions served by a cached model')
+
 class SentimentPredictorNode:
     def __init__(self, csv_path):
         self.csv_path = csv_path
@@ -52,6 +58,7 @@ class SentimentPredictorNode:
                         self.totals[current_s] += 1
             
             self.trained = True
+            NODE_2_TRAINS.inc()
             # print(f"DEBUG: Node 2 trained on {target_path}")
             
         except Exception as e:
@@ -85,12 +92,43 @@ class SentimentPredictorNode:
         probability = max_count / total
         return best_next, probability
 
-def run_node_2_analysis(csv_path, current_sentiment):
+# training_path -> ((mtime_ns, size), trained predictor)
+_model_cache = {}
+_model_cache_lock = threading.Lock()
+
+
+def get_trained_predictor(csv_path):
     """
-    Main entry point for Node 2.
+    Returns a trained predictor for csv_path. The model is reused for as long
+    as its training file is unchanged (same mtime and size), so the CSV is
+    only re-read after it has been modified.
     """
     predictor = SentimentPredictorNode(csv_path)
+    try:
+        st = os.stat(predictor.training_path)
+        signature = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        signature = None
+
+    if signature is not None:
+        with _model_cache_lock:
+            cached = _model_cache.get(predictor.training_path)
+        if cached is not None and cached[0] == signature:
+            NODE_2_CACHE_HITS.inc()
+            return cached[1]
+
     predictor.load_and_train()
+    if predictor.trained and signature is not None:
+        with _model_cache_lock:
+            _model_cache[predictor.training_path] = (signature, predictor)
+    return predictor
+
+
+def run_node_2_analysis(csv_path, current_sentiment):
+    """
+    Main entry point for Node 2.
+    """
+    predictor = get_trained_predictor(csv_path)
     prediction, probability = predictor.predict_next(current_sentiment)
     
     return {
@@ -16,9 +16,14 @@ import random
 import json
 import os
 import datetime
+import threading
 from collections import defaultdict
 import re
 
+from core_analysis.lexicon import get_lexicon
+from core_analysis.profiling import span
+from core_analysis.metrics import histogram, gauge
+
 # Sentiment Constants
 SENTIMENT_RANGES = {
     'Very Positive': (0.6, 1.0),
@@ -38,10 +43,53 @@ COLORS = {
     'RESET': '\033[0m'
 }
 
+# Interactions kept in memory and in the insight store; older ones are only
+# in the append-only interaction log next to it
+MAX_RECENT_INTERACTIONS = int(os.environ.get('SENTIMENT_INSIGHTS_RECENT', '1000'))
+
+
 class UserInsightEngine:
+    """
+    Thread-safe insight store.
+
+    Mutations hold self._lock only long enough to append and count. Saves are
+    serialized by self._save_lock and written atomically (temp file + rename);
+    a thread whose update was already included in another thread's save skips
+    its own, so concurrent requests share one file write instead of queueing
+    a rewrite each.
+
+    A save costs O(MAX_RECENT_INTERACTIONS), not O(all interactions ever):
+    the store holds the patterns and the most recent interactions, and each
+    save appends the interactions recorded since the previous one to the
+    interaction log (one JSON object per line), which keeps the full history.
+    """
     def __init__(self):
-        self.db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'user_insights.json')
+        self.db_path = self.default_db_path()
         self.insights = self._load_db()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._version = 0        # incremented by every mutation
+        self._saved_version = 0  # last version written to disk
+        # Interactions not yet in the log. Without a log, the store predates it
+        # and every interaction it holds goes there; older ones are then also
+        # dropped from memory, which keeps only the recent window
+        recent = self.insights["interactions"]
+        if not os.path.exists(self.log_path):
+            self._unlogged = list(recent)
+        else:
+            self._unlogged = recent[:-MAX_RECENT_INTERACTIONS] if len(recent) > MAX_RECENT_INTERACTIONS else []
+        del recent[:max(len(recent) - MAX_RECENT_INTERACTIONS, 0)]
+
+    @staticmethod
+    def default_db_path():
+        # SENTIMENT_INSIGHTS_DB overrides the location (e.g. for load tests)
+        if os.environ.get('SENTIMENT_INSIGHTS_DB'):
+            return os.environ['SENTIMENT_INSIGHTS_DB']
+        return os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'user_insights.json')
+
+    @property
+    def log_path(self):
+        return os.path.splitext(self.db_path)[0] + '_log.jsonl'
 
     def _load_db(self):
         if os.path.exists(self.db_path):
@@ -52,14 +100,39 @@ class UserInsightEngine:
                 return {"interactions": [], "patterns": {}}
         return {"interactions": [], "patterns": {}}
 
-    def _save_db(self):
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        with open(self.db_path, 'w') as f:
-            json.dump(self.insights, f, indent=4)
+    def _save_db(self, version=None):
+        """Writes the store to disk unless a save covering `version` already happened."""
+        with self._save_lock:
+            if version is not None and self._saved_version >= version:
+                return
+            with self._lock:
+                # Interactions are never modified after being appended, so a
+                # shallow copy of the list is a consistent snapshot
+                snapshot = {key: value for key, value in self.insights.items()}
+                snapshot["interactions"] = self.insights["interactions"][-MAX_RECENT_INTERACTIONS:]
+                snapshot["patterns"] = json.loads(json.dumps(self.insights["patterns"]))
+                snapshot_version = self._version
+                unlogged, self._unlogged = self._unlogged, []
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            try:
+                if unlogged:
+                    with open(self.log_path, 'a') as f:
+                        f.write(''.join(json.dumps(i, separators=(',', ':')) + '\n' for i in unlogged))
+            except BaseException:
+                with self._lock:
+                    self._unlogged[:0] = unlogged
+                raise
+            tmp_path = self.db_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f, separators=(',', ':'))
+            os.replace(tmp_path, self.db_path)
+            self._saved_version = snapshot_version
 
-    def track_interaction(self, user_text, sentiment_category, node_1_score, node_2_prediction, final_score):
+    def track_interaction(self, user_text, sentiment_category, node_1_score, node_2_prediction, final_score, save=True):
         """
         Stores analysis of previous checks to build a knowledge base.
+        With save=False the interaction is only recorded in memory; call
+        save() once after a batch of them.
         """
         interaction = {
             "timestamp": datetime.datetime.now().isoformat(),
@@ -69,23 +142,39 @@ class UserInsightEngine:
             "node_1_input": node_1_score,
             "node_2_prediction": node_2_prediction
         }
-        self.insights["interactions"].append(interaction)
-        
-        # Update patterns: How does user respond to different contexts?
-        # Simple pattern: Count frequency of sentiments
-        if "sentiment_counts" not in self.insights["patterns"]:
-            self.insights["patterns"]["sentiment_counts"] = {}
-        
-        counts = self.insights["patterns"]["sentiment_counts"]
-        counts[sentiment_category] = counts.get(sentiment_category, 0) + 1
+        with self._lock:
+            recent = self.insights["interactions"]
+            recent.append(interaction)
+            self._unlogged.append(interaction)
+            if len(recent) >= 2 * MAX_RECENT_INTERACTIONS:
+                # Trimmed in chunks so the cost per interaction stays constant
+                del recent[:-MAX_RECENT_INTERACTIONS]
+            
+            # Update patterns: How does user respond to different contexts?
+            # Simple pattern: Count frequency of sentiments
+            if "sentiment_counts" not in self.insights["patterns"]:
+                self.insights["patterns"]["sentiment_counts"] = {}
+            
+            counts = self.insights["patterns"]["sentiment_counts"]
+            counts[sentiment_category] = counts.get(sentiment_category, 0) + 1
+            self._version += 1
+            version = self._version
         
-        self._save_db()
+        if save:
+            self._save_db(version)
+
+    def save(self):
+        """Writes any interactions recorded with save=False."""
+        with self._lock:
+            version = self._version
+        self._save_db(version)
 
     def get_user_impersonation_profile(self):
         """
         Returns the most accurate approach/emotion the user follows.
         """
-        counts = self.insights["patterns"].get("sentiment_counts", {})
+        with self._lock:
+            counts = dict(self.insights["patterns"].get("sentiment_counts", {}))
         if not counts:
             return "Neutral"
         
@@ -119,31 +208,20 @@ def analyze_context(text, history_messages):
     Analyzes message context within specified sentiment score ranges.
     """
     text_lower = text.lower()
+    lexicon = get_lexicon()
+    found = lexicon.find_phrases(text_lower)
     
-    sarcasm_indicators = ["oh great", "thanks a lot", "yeah right", "wow"]
-    is_sarcastic = any(phrase in text_lower for phrase in sarcasm_indicators) and ("!" in text or "..." in text)
+    is_sarcastic = not found.isdisjoint(lexicon.sarcasm_indicators) and ("!" in text or "..." in text)
     
     base_score = 0.0
-    positive_words = ["good", "great", "happy", "love", "excellent", "thanks", "amazing", "best", "fantastic", "awesome", "cool", "nice"]
-    negative_words = ["bad", "hate", "terrible", "sad", "angry", "worst", "awful", "broken", "refund", "slow", "hell", "damn", "wtf", "fish", "crap", "shit", "sucks", "idiot", "stupid", "useless", "garbage", "trash", "annoying", "disgusting", "kidding"]
-    interjection_negatives = ["what the hell", "what the fish", "wtf", "damn", "screw this", "this sucks", "are you kidding", "oh come on", "you gotta be kidding"]
-    
-    pos_count = 0
-    neg_count = 0
-    for word in positive_words:
-        if word in text_lower:
-            base_score += 0.3
-            pos_count += 1
-            
-    for word in negative_words:
-        if word in text_lower:
-            base_score -= 0.3
-            neg_count += 1
+    pos_count = len(found & lexicon.positive_words)
+    neg_count = len(found & lexicon.negative_words)
+    interjection_count = len(found & lexicon.interjection_negatives)
 
-    for phrase in interjection_negatives:
-        if phrase in text_lower:
-            base_score -= 0.4
-            neg_count += 1
+    base_score += 0.3 * pos_count
+    base_score -= 0.3 * neg_count
+    base_score -= 0.4 * interjection_count
+    neg_count += interjection_count
 
     exclamations = text.count("!")
     if exclamations > 0:
@@ -168,7 +246,8 @@ def analyze_context(text, history_messages):
 
 def apply_dynamic_biases(current_score, prediction_data, insight_engine):
     """
-    Applies dynamic biases using Node 2 prediction and Historical Insights.
+    Applies dynamic biases using Node 2 prediction and Historical Insights
+    (skipped when insight_engine is None).
     """
     bias = 0.0
     
@@ -183,7 +262,7 @@ def apply_dynamic_biases(current_score, prediction_data, insight_engine):
             bias -= 0.2 * probability
 
     # 2. Historical Insight Bias (Impersonation)
-    dominant_sentiment = insight_engine.get_user_impersonation_profile()
+    dominant_sentiment = insight_engine.get_user_impersonation_profile() if insight_engine else None
     if dominant_sentiment in ['Very Positive', 'Positive']:
         bias += 0.05 # Slight positive tilt if user is generally happy
     elif dominant_sentiment in ['Very Negative', 'Negative']:
@@ -222,16 +301,48 @@ def get_sentiment_category(score, is_sarcastic, pos_count, neg_count, is_factual
     # Default: Neutral when signals are weak or balanced
     return 'Neutral'
 
-# Singleton Engine
-engine = UserInsightEngine()
+# Singleton Engine, created on first use so importing this module does not
+# parse user_insights.json
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_insight_engine():
+    """Returns the shared UserInsightEngine, loading the insight store on first call."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = UserInsightEngine()
+    return _engine
+
+def _insights_store_interactions():
+    # Reported only once the store is loaded; scraping must not load it
+    if _engine is None:
+        return None
+    with _engine._lock:
+        return len(_engine.insights.get("interactions", []))
+
+def _insights_store_bytes():
+    path = _engine.db_path if _engine is not None else UserInsightEngine.default_db_path()
+    return os.path.getsize(path) if os.path.exists(path) else None
 
-def run_core_analysis(text, node_1_result, node_2_result, history_messages):
+NODE_3_SCORING_SECONDS = histogram('node3_scoring_seconds', 'Node 3 context scoring time')
+INSIGHTS_SAVE_SECONDS = histogram('insights_save_seconds', 'Time to record an interaction in the insight store')
+gauge('insights_store_interactions', 'Interactions held in the insight store', _insights_store_interactions)
+gauge('insights_store_bytes', 'Size of the insight store file in bytes', _insights_store_bytes)
+
+def __getattr__(name):
+    # Backwards compatibility for `from core_analysis.node_3 import engine`
+    if name == 'engine':
+        return get_insight_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def score_message(text, node_1_result, node_2_result, history_messages=None, use_insights=True):
     """
-    Main entry point for Node 3.
-    Integrates Node 1, Node 2, and Insight Engine.
+    Scores a message with Node 3 without recording it in the insight store.
+    Used by run_core_analysis and by offline tools that rescore datasets.
+    With use_insights=False the insight store is not loaded or consulted.
     """
-    # print(f"DEBUG: Node 3 Analyzing: '{text}'")
-    
     # 1. Context Analysis
     context_data = analyze_context(text, history_messages)
     context_score = context_data['context_score']
@@ -255,21 +366,11 @@ def run_core_analysis(text, node_1_result, node_2_result, history_messages):
     raw_score = (node_1_score * w1) + (context_score * w_context)
     
     # 5. Apply Dynamic Biases
-    final_score = apply_dynamic_biases(raw_score, node_2_result, engine)
+    final_score = apply_dynamic_biases(raw_score, node_2_result, get_insight_engine() if use_insights else None)
     
     # 6. Classification
     category = get_sentiment_category(final_score, is_sarcastic, pos_count, neg_count, is_factual)
     
-    # 7. Learn & Store (Parallel task conceptually)
-    engine.track_interaction(
-        user_text=text,
-        sentiment_category=category,
-        node_1_score=node_1_score,
-        node_2_prediction=node_2_result.get('prediction'),
-        final_score=final_score
-    )
-    
-    # 8. Output
     color = COLORS.get(category, COLORS['RESET'])
     
     return {
@@ -277,6 +378,34 @@ def run_core_analysis(text, node_1_result, node_2_result, history_messages):
         'category': category,
         'color_code': color,
         'is_sarcastic': is_sarcastic,
-        'node_2_prediction': node_2_result.get('prediction'),
+        'node_1_score': node_1_score,
+        'node_2_prediction': (node_2_result or {}).get('prediction'),
         'description': f"Score: {final_score:.2f} ({category})"
     }
+
+def run_core_analysis(text, node_1_result, node_2_result, history_messages, save=True):
+    """
+    Main entry point for Node 3.
+    Integrates Node 1, Node 2, and Insight Engine.
+    With save=False the insight store is updated in memory only (see
+    UserInsightEngine.save), for callers that persist once per batch.
+    """
+    # print(f"DEBUG: Node 3 Analyzing: '{text}'")
+    
+    # 1-6. Context analysis, weighting, biases and classification
+    with NODE_3_SCORING_SECONDS.time():
+        result = score_message(text, node_1_result, node_2_result, history_messages)
+    
+    # 7. Learn & Store (Parallel task conceptually)
+    with span('insights_save'), INSIGHTS_SAVE_SECONDS.time():
+        get_insight_engine().track_interaction(
+            user_text=text,
+            sentiment_category=result['category'],
+            node_1_score=result['node_1_score'],
+            node_2_prediction=result['node_2_prediction'],
+            final_score=result['composite_score'],
+            save=save
+        )
+    
+    # 8. Output
+    return result
@@ -0,0 +1,145 @@
+"""
+profiling.py
+Lightweight per-stage latency instrumentation for the Node 1/2/3 pipeline.
+
+Usage:
+    from core_analysis.profiling import span
+
+    with span('node_2'):
+        run_node_2_analysis(...)
+
+Timings are aggregated per stage into a rolling window of the most recent
+MAX_SAMPLES durations, from which get_stats() reports p50/p95/p99.
+
+Profiling is off unless SENTIMENT_PROFILE=1 is set or enable() is called.
+When off, span() hands back a shared no-op context manager, so instrumented
+code pays one flag check per stage.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+MAX_SAMPLES = 2048
+
+_enabled = os.environ.get('SENTIMENT_PROFILE', '0') not in ('', '0')
+_lock = threading.Lock()
+_samples = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+_counts = defaultdict(int)
+_totals = defaultdict(float)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.name, (time.perf_counter() - self.start) * 1000.0)
+        return False
+
+
+def span(name):
+    """Returns a context manager timing the enclosed block under `name`."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def record(name, duration_ms):
+    """Records one duration (in milliseconds) for a stage."""
+    with _lock:
+        _samples[name].append(duration_ms)
+        _counts[name] += 1
+        _totals[name] += duration_ms
+
+
+def _percentile(sorted_values, pct):
+    # Nearest-rank percentile on an already sorted list
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def get_stats():
+    """
+    Returns per-stage latency statistics.
+
+    Returns:
+        dict: stage -> {'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'}
+              count and mean cover every recorded call; percentiles and max
+              cover the most recent MAX_SAMPLES calls.
+    """
+    with _lock:
+        snapshot = {name: (sorted(samples), _counts[name], _totals[name])
+                    for name, samples in _samples.items()}
+
+    stats = {}
+    for name, (values, count, total) in snapshot.items():
+        stats[name] = {
+            'count': count,
+            'mean_ms': round(total / count, 3) if count else 0.0,
+            'p50_ms': round(_percentile(values, 50), 3),
+            'p95_ms': round(_percentile(values, 95), 3),
+            'p99_ms': round(_percentile(values, 99), 3),
+            'max_ms': round(values[-1], 3) if values else 0.0,
+        }
+    return stats
+
+
+def dump_json(path=None):
+    """
+    Serializes get_stats() as JSON. Writes it to `path` when given.
+
+    Returns:
+        str: The JSON document.
+    """
+    payload = json.dumps({'enabled': _enabled, 'stages': get_stats()}, indent=2)
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+    return payload
+
+
+def reset():
+    """Clears all recorded timings."""
+    with _lock:
+        _samples.clear()
+        _counts.clear()
+        _totals.clear()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
@@ -7,27 +7,121 @@ Features:
 - Maps sentiment to color codes and descriptions
 - Returns structured sentiment data for UI display
 - Supports historical context analysis
+- Caches polarity per message so history is not re-analyzed
+- Batch analysis across a persistent process pool
+- Optional fast lexicon-only engine (see fast_polarity.py)
 """
 
-from textblob import TextBlob
+import atexit
+import hashlib
 import json
-from typing import Dict, Tuple, List
+import os
+import threading
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Dict, Tuple, List, Union, Iterable, Iterator, Optional
 
+# TextBlob (and the NLTK stack behind it) is imported on first use, so that
+# importing this module does not pay its import and lexicon-load cost.
+_TextBlob = None
 
-def analyze_emotion(text: str) -> Tuple[float, float]:
+# Polarity engines: 'textblob' (reference) or 'fast' (fast_polarity.py)
+ENGINES = ('textblob', 'fast')
+_default_engine = os.environ.get('SENTIMENT_ENGINE', 'textblob')
+if _default_engine not in ENGINES:
+    _default_engine = 'textblob'
+
+
+def _get_textblob():
+    """Returns the TextBlob class, importing it on first call."""
+    global _TextBlob
+    if _TextBlob is None:
+        from textblob import TextBlob
+        _TextBlob = TextBlob
+    return _TextBlob
+
+
+def set_sentiment_engine(engine: str):
     """
-    Analyzes the sentiment of the text using TextBlob.
+    Selects the default polarity engine for analyze_emotion().
+    
+    Args:
+        engine (str): 'textblob' or 'fast'
+    """
+    global _default_engine
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown sentiment engine: {engine!r} (expected one of {ENGINES})")
+    _default_engine = engine
+
+
+def get_sentiment_engine() -> str:
+    return _default_engine
+
+
+def analyze_emotion(text: str, engine: Optional[str] = None) -> Tuple[float, float]:
+    """
+    Analyzes the sentiment of the text using TextBlob (or the fast lexicon engine).
     
     Args:
         text (str): The input text to analyze
+        engine (str): 'textblob' or 'fast'; defaults to set_sentiment_engine()
         
     Returns:
         tuple: (polarity, subjectivity)
             - Polarity: -1 (negative) to 1 (positive)
             - Subjectivity: 0 (objective) to 1 (subjective)
     """
-    blob = TextBlob(text)
-    return blob.sentiment.polarity, blob.sentiment.subjectivity
+    if (engine or _default_engine) == 'fast':
+        from core_analysis.fast_polarity import fast_sentiment
+        return fast_sentiment(text)
+    sentiment = _get_textblob()(text).sentiment
+    return sentiment.polarity, sentiment.subjectivity
+
+
+# Bounded LRU of (polarity, subjectivity) keyed by message hash. Messages are
+# scored once when they arrive; history lookups then hit the cache.
+POLARITY_CACHE_SIZE = 10000
+_polarity_cache = OrderedDict()
+_polarity_cache_lock = threading.Lock()
+
+
+def _message_key(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def cached_emotion(text: str, engine: Optional[str] = None) -> Tuple[float, float]:
+    """
+    Same as analyze_emotion(), but served from the polarity cache when
+    this exact text has been analyzed before.
+    
+    Args:
+        text (str): The input text to analyze
+        engine (str): 'textblob' or 'fast'; defaults to set_sentiment_engine()
+        
+    Returns:
+        tuple: (polarity, subjectivity)
+    """
+    engine = engine or _default_engine
+    key = (engine, _message_key(text))
+    with _polarity_cache_lock:
+        hit = _polarity_cache.get(key)
+        if hit is not None:
+            _polarity_cache.move_to_end(key)
+            return hit
+
+    result = analyze_emotion(text, engine)
+
+    with _polarity_cache_lock:
+        _polarity_cache[key] = result
+        _polarity_cache.move_to_end(key)
+        while len(_polarity_cache) > POLARITY_CACHE_SIZE:
+            _polarity_cache.popitem(last=False)
+    return result
+
+
+def clear_polarity_cache():
+    with _polarity_cache_lock:
+        _polarity_cache.clear()
 
 
 def get_sentiment_color(polarity: float) -> str:
@@ -93,12 +187,13 @@ def get_sentiment_category(polarity: float) -> Dict[str, str]:
         }
 
 
-def analyze_chat_message(text: str) -> Dict:
+def analyze_chat_message(text: str, engine: Optional[str] = None) -> Dict:
     """
     Comprehensive sentiment analysis for a chat message.
     
     Args:
         text (str): The chat message text
+        engine (str): 'textblob' or 'fast'; defaults to set_sentiment_engine()
         
     Returns:
         dict: Comprehensive sentiment analysis with:
@@ -111,7 +206,7 @@ def analyze_chat_message(text: str) -> Dict:
             - description: Sentiment description
             - is_positive: Boolean indicator
     """
-    polarity, subjectivity = analyze_emotion(text)
+    polarity, subjectivity = cached_emotion(text, engine)
     sentiment_info = get_sentiment_category(polarity)
     
     result = {
@@ -130,14 +225,20 @@ def analyze_chat_message(text: str) -> Dict:
     return result
 
 
-def analyze_historical_context(current_message: str, previous_messages: List[str]) -> Dict:
+def analyze_historical_context(current_message: str, previous_messages: List[Union[str, Dict]]) -> Dict:
     """
     Analyzes sentiment of current message with context from previous messages.
     Helps understand sentiment trends and patterns.
     
+    Previous messages are scored on the same scale as the current one, from
+    their text: history rows (dicts as returned by storage.get_history) use
+    their 'text', not the stored 'sentiment_polarity' (the Node 3 composite
+    score). Texts are looked up in the polarity cache, so TextBlob only runs
+    on cache misses.
+    
     Args:
         current_message (str): The current message to analyze
-        previous_messages (list): List of previous message texts
+        previous_messages (list): Previous message texts, or history row dicts
         
     Returns:
         dict: Analysis with context insights
@@ -148,7 +249,8 @@ def analyze_historical_context(current_message: str, previous_messages: List[str
     previous_polarities = []
     if previous_messages:
         for msg in previous_messages[-5:]:  # Last 5 messages for context
-            _, pol = analyze_emotion(msg)
+            text = (msg.get('text') or '') if isinstance(msg, dict) else msg
+            pol, _ = cached_emotion(text)
             previous_polarities.append(pol)
     
     # Calculate trend
@@ -170,17 +272,132 @@ def analyze_historical_context(current_message: str, previous_messages: List[str
     return current_analysis
 
 
-def batch_analyze_messages(messages: List[str]) -> List[Dict]:
+# Persistent worker pool for batch analysis. TextBlob's analyzer is pure
+# Python, so throughput only scales with processes, not threads.
+DEFAULT_CHUNK_SIZE = 256
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            # Imported here: multiprocessing is a noticeable share of import time
+            from concurrent.futures import ProcessPoolExecutor
+            if _pool is not None:
+                _pool.shutdown(wait=True)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool():
+    """Stops the batch worker processes (they are restarted on next use)."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+        _pool = None
+        _pool_workers = 0
+
+
+atexit.register(shutdown_pool)
+
+
+def _analyze_chunk(messages: List[str], engine: str) -> List[Dict]:
+    # Runs inside a worker process
+    return [analyze_chat_message(msg, engine) for msg in messages]
+
+
+def _emotion_chunk(messages: List[str], engine: str) -> List[Tuple[float, float]]:
+    # Runs inside a worker process
+    return [analyze_emotion(msg, engine) for msg in messages]
+
+
+def _iter_chunked(chunk_func, messages: Iterable[str], workers: int,
+                  chunk_size: int, engine: str) -> Iterator:
+    """Runs chunk_func over chunks of messages in the pool, yielding in input order."""
+    pool = _get_pool(workers)
+    max_in_flight = workers * 2
+    it = iter(messages)
+    pending = deque()
+    exhausted = False
+    while pending or not exhausted:
+        while not exhausted and len(pending) < max_in_flight:
+            chunk = list(islice(it, chunk_size))
+            if not chunk:
+                exhausted = True
+                break
+            pending.append(pool.submit(chunk_func, chunk, engine))
+        if pending:
+            yield from pending.popleft().result()
+
+
+def iter_analyze_messages(messages: Iterable[str], workers: Optional[int] = 1,
+                          chunk_size: int = DEFAULT_CHUNK_SIZE,
+                          engine: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Analyzes messages and yields results in input order as they complete.
+    
+    With workers > 1 the input is cut into chunks of `chunk_size` and spread
+    over a persistent process pool. At most 2 * workers chunks are in flight,
+    so memory stays constant for arbitrarily long (e.g. streamed) inputs.
+    
+    Args:
+        messages (iterable): Message texts; may be a generator
+        workers (int): Worker processes; 1 runs in-process, None uses all cores
+        chunk_size (int): Messages per task sent to a worker
+        engine (str): 'textblob' or 'fast'; defaults to set_sentiment_engine()
+        
+    Yields:
+        dict: Sentiment analysis per message, same order as the input
+    """
+    # Resolve the engine here so workers don't depend on their own global default
+    engine = engine or _default_engine
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for msg in messages:
+            yield analyze_chat_message(msg, engine)
+        return
+    yield from _iter_chunked(_analyze_chunk, messages, workers, chunk_size, engine)
+
+
+def iter_emotions(messages: Iterable[str], workers: Optional[int] = 1,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  engine: Optional[str] = None) -> Iterator[Tuple[float, float]]:
+    """
+    Like iter_analyze_messages(), but yields raw (polarity, subjectivity)
+    tuples. Bypasses the polarity cache, for one-off bulk scoring.
+    """
+    engine = engine or _default_engine
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for msg in messages:
+            yield analyze_emotion(msg, engine)
+        return
+    yield from _iter_chunked(_emotion_chunk, messages, workers, chunk_size, engine)
+
+
+def batch_analyze_messages(messages: List[str], workers: Optional[int] = 1,
+                           chunk_size: int = DEFAULT_CHUNK_SIZE,
+                           engine: Optional[str] = None) -> List[Dict]:
     """
     Analyzes multiple messages at once.
     
     Args:
         messages (list): List of message texts
+        workers (int): Worker processes; 1 runs serially, None uses all cores
+        chunk_size (int): Messages per task sent to a worker
+        engine (str): 'textblob' or 'fast'; defaults to set_sentiment_engine()
         
     Returns:
         list: List of sentiment analysis dictionaries
     """
-    return [analyze_chat_message(msg) for msg in messages]
+    return list(iter_analyze_messages(messages, workers=workers, chunk_size=chunk_size, engine=engine))
 
 
 def format_message_for_display(analysis: Dict, text: str) -> Dict:
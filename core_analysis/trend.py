@@ -0,0 +1,119 @@
+"""
+trend.py
+Incremental per-contact sentiment trend tracking.
+
+Each contact keeps two exponentially weighted moving averages of its
+composite scores: a fast one (recent mood) and a slow one (baseline).
+The trend is 'improving' when the fast average is above the baseline by more
+than TREND_THRESHOLD, 'declining' when below, and 'stable' otherwise.
+
+Updates are O(1) per message and never read the history CSV. State is
+persisted next to the history (storage.save_trends), at most every
+SAVE_INTERVAL seconds and at exit. If no saved state exists yet, it is
+bootstrapped once from the history CSV.
+"""
+
+import atexit
+import threading
+import time
+
+from ui_io.storage import load_trends, save_trends, iter_scored_messages
+
+FAST_ALPHA = 0.5
+SLOW_ALPHA = 0.1
+TREND_THRESHOLD = 0.1
+SAVE_INTERVAL = 2.0
+
+
+class TrendTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None  # contact_id -> {'fast', 'slow', 'count'}
+        self._dirty = False
+        self._last_save = 0.0
+
+    def _ensure_loaded(self):
+        # Caller holds self._lock
+        if self._state is not None:
+            return
+        state = load_trends()
+        if state is None:
+            state = {}
+            for contact_id, score in iter_scored_messages():
+                self._apply(state, contact_id, score)
+            self._dirty = True
+        self._state = state
+
+    @staticmethod
+    def _apply(state, contact_id, score):
+        entry = state.get(contact_id)
+        if entry is None:
+            state[contact_id] = {'fast': score, 'slow': score, 'count': 1}
+            return state[contact_id]
+        entry['fast'] += FAST_ALPHA * (score - entry['fast'])
+        entry['slow'] += SLOW_ALPHA * (score - entry['slow'])
+        entry['count'] += 1
+        return entry
+
+    @staticmethod
+    def _classify(entry):
+        if not entry or entry['count'] < 2:
+            return 'stable'
+        diff = entry['fast'] - entry['slow']
+        if diff > TREND_THRESHOLD:
+            return 'improving'
+        if diff < -TREND_THRESHOLD:
+            return 'declining'
+        return 'stable'
+
+    def update(self, contact_id, score):
+        """
+        Folds a new composite score into the contact's trend.
+
+        Returns:
+            str: 'improving', 'declining' or 'stable'
+        """
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._apply(self._state, str(contact_id), float(score))
+            trend = self._classify(entry)
+            self._dirty = True
+            if time.monotonic() - self._last_save >= SAVE_INTERVAL:
+                self._save_locked()
+        return trend
+
+    def preload(self):
+        """Loads (or bootstraps) the trend state now instead of on first update."""
+        with self._lock:
+            self._ensure_loaded()
+
+    def get_trend(self, contact_id):
+        with self._lock:
+            self._ensure_loaded()
+            return self._classify(self._state.get(str(contact_id)))
+
+    def flush(self):
+        """Persists pending updates immediately."""
+        with self._lock:
+            if self._dirty:
+                self._save_locked()
+
+    def _save_locked(self):
+        save_trends(self._state)
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_trend_tracker():
+    """Returns the shared TrendTracker, created on first use."""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = TrendTracker()
+                atexit.register(_tracker.flush)
+    return _tracker
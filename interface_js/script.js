@@ -14,6 +14,11 @@ document.addEventListener('DOMContentLoaded', () => {
   // Sentiment analysis state
   let isAnalyzing = false;
 
+  // Per-tab id sent with each message, so the live stream can skip this tab's own echoes
+  const clientId = (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : `tab-${Date.now()}-${Math.random().toString(36).slice(2)}`;
+  let messageCounter = 0;
+  let eventSource = null;
+
   // Sample contacts (now include avatar images)
   const contacts = [
     {id: 'support', name: 'Support', status: 'Online', avatar: 'assets/avatar_support.svg'},
@@ -25,6 +30,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
   // Storage helpers (per-contact)
   function storageKeyFor(contactId){ return `chat_history_v1_${contactId}` }
+  function syncCursorKeyFor(contactId){ return `chat_sync_cursor_v1_${contactId}` }
+  function newMessageId(){ return `${clientId}-${++messageCounter}` }
 
   // Time formatting (clean inline format)
   function nowTime(){
@@ -130,7 +137,8 @@ document.addEventListener('DOMContentLoaded', () => {
     let history = [];
     try{ const raw = localStorage.getItem(storageKeyFor(contactId)); history = raw ? JSON.parse(raw) : [] }catch(e){ history = [] }
     const ts = nowTime();
-    const msg = {text, time: ts.time, date: ts.date, iso: ts.iso, dir};
+    // Not stored on the server yet (synced: false); the next sync uploads it
+    const msg = {id: newMessageId(), text, time: ts.time, date: ts.date, iso: ts.iso, dir, synced: false};
     history.push(msg);
     saveHistory(history, contactId);
     renderMessage(msg);
@@ -155,6 +163,7 @@ document.addEventListener('DOMContentLoaded', () => {
       submitBtn.textContent = 'Analyzing...';
     }
     
+    const messageId = newMessageId();
     try {
       const response = await fetch('/api/analyze', {
         method: 'POST',
@@ -162,7 +171,9 @@ document.addEventListener('DOMContentLoaded', () => {
         body: JSON.stringify({
           text: text,
           contact_id: currentContact.id,
-          contact_name: currentContact.name
+          contact_name: currentContact.name,
+          client_id: clientId,
+          message_id: messageId
         })
       });
       
@@ -182,11 +193,13 @@ document.addEventListener('DOMContentLoaded', () => {
         
         const ts = nowTime();
         const msg = {
+          id: messageId,
           text: text,
           time: ts.time,
           date: ts.date,
           iso: ts.iso,
           dir: 'sent',
+          synced: true,
           sentiment: {
             emoji: result.sentiment.emoji,
             category: result.sentiment.category,
@@ -196,7 +209,8 @@ document.addEventListener('DOMContentLoaded', () => {
           }
         };
         
-        history.push(msg);
+        // Another tab of this browser may have stored it already from the live stream
+        if(!history.some(h => h.id === msg.id)) history.push(msg);
         saveHistory(history, currentContact.id);
         renderMessage(msg);
         scrollBottom();
@@ -251,7 +265,7 @@ document.addEventListener('DOMContentLoaded', () => {
       const replyText = cannedReplyFor(userMsg);
       // add to history as 'received'
       const ts = nowTime();
-      const reply = {text: replyText, time: ts.time, date: ts.date, iso: ts.iso, dir: 'received'};
+      const reply = {id: newMessageId(), text: replyText, time: ts.time, date: ts.date, iso: ts.iso, dir: 'received', synced: false};
       // load, append, save
       let history = [];
       try{ const raw = localStorage.getItem(storageKeyFor(contactId)); history = raw ? JSON.parse(raw) : [] }catch(e){ history = [] }
@@ -290,9 +304,143 @@ document.addEventListener('DOMContentLoaded', () => {
     // mark active
     Array.from(contactsListEl.children).forEach(li=> li.classList.toggle('active', li.querySelector('.c-name').textContent === c.name));
     loadHistory(contactId);
+    subscribeToContact(contactId);
+    syncContact(contactId);
   }
 
-  // Live-chat and server-facing code removed. Use `storage.py` for CSV persistence.
+  // History sync: uploads messages the server has not stored (sent while it
+  // was unreachable, auto replies) and fetches messages stored elsewhere since
+  // the last sync, in one request. The server deduplicates by message id, so
+  // repeating a sync is harmless.
+  const _syncing = {};
+
+  function fromServerMessage(m, contactId, position){
+    return {
+      id: m.message_id || `server-${contactId}-${position}`,
+      text: m.text, time: m.time, date: m.date, iso: m.iso, dir: m.dir || 'sent', synced: true,
+      sentiment: m.sentiment_category ? {
+        emoji: m.sentiment_emoji, category: m.sentiment_category, description: '',
+        color: m.color_hex, polarity: parseFloat(m.sentiment_polarity)
+      } : undefined
+    };
+  }
+
+  async function syncContact(contactId){
+    if(_syncing[contactId]) return;
+    _syncing[contactId] = true;
+    try{
+      let history = [];
+      try{ const raw = localStorage.getItem(storageKeyFor(contactId)); history = raw ? JSON.parse(raw) : [] }catch(e){ history = [] }
+      const rawCursor = localStorage.getItem(syncCursorKeyFor(contactId));
+      const firstSync = rawCursor === null;
+      // Messages saved before ids existed: assume the server already has the
+      // sent ones (they went through /api/analyze) and keep the rest local.
+      // The ids given here are matched to the re-read copy below by content and time.
+      const legacyIds = new Map();
+      const legacyKey = h => `${h.dir}\u0000${h.iso || `${h.date} ${h.time}`}\u0000${h.text}`;
+      history.forEach(h => {
+        if(!h.id){
+          h.id = newMessageId();
+          h.synced = true;
+          const key = legacyKey(h);
+          legacyIds.set(key, [...(legacyIds.get(key) || []), h.id]);
+        }
+      });
+      const pending = history.filter(h => h.synced === false);
+
+      const response = await fetch('/api/sync', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({
+          contact_id: contactId,
+          contact_name: (contacts.find(c => c.id === contactId) || {}).name,
+          client_id: clientId,
+          since: firstSync ? 0 : parseInt(rawCursor, 10) || 0,
+          messages: pending.map(h => ({id: h.id, text: h.text, dir: h.dir, iso: h.iso, date: h.date, time: h.time, sentiment: h.sentiment}))
+        })
+      });
+      if(!response.ok) return;
+      const result = await response.json();
+      if(!result.success) return;
+
+      // Re-read: other tabs or the live stream may have saved meanwhile
+      let latest = [];
+      try{ const raw = localStorage.getItem(storageKeyFor(contactId)); latest = raw ? JSON.parse(raw) : [] }catch(e){ latest = [] }
+      latest.forEach(h => {
+        if(!h.id){
+          const ids = legacyIds.get(legacyKey(h));
+          h.id = ids && ids.length ? ids.shift() : newMessageId();
+          h.synced = true;
+        }
+      });
+
+      const acknowledged = new Set([...(result.stored || []), ...(result.duplicates || [])]);
+      latest.forEach(h => {
+        if(acknowledged.has(h.id)) h.synced = true;
+        const s = (result.sentiments || {})[h.id];
+        if(s) h.sentiment = {emoji: s.emoji, category: s.category, description: s.description, color: s.color, polarity: s.polarity_score};
+      });
+
+      const known = new Set(latest.map(h => h.id));
+      // Rows stored without ids (before ids existed) may be copies of local messages
+      const legacy = new Set(latest.map(h => `${h.dir}\u0000${h.text}`));
+      const firstPosition = (result.cursor || 0) - (result.messages || []).length;
+      let added = 0;
+      (result.messages || []).forEach((m, i) => {
+        const msg = fromServerMessage(m, contactId, firstPosition + i);
+        if(known.has(msg.id)) return;
+        if(firstSync && !m.message_id && legacy.has(`${msg.dir}\u0000${msg.text}`)) return;
+        known.add(msg.id);
+        latest.push(msg);
+        added++;
+      });
+
+      saveHistory(latest, contactId);
+      localStorage.setItem(syncCursorKeyFor(contactId), String(result.cursor || 0));
+      if(added && currentContact && currentContact.id === contactId) loadHistory(contactId);
+    }catch(err){
+      console.warn('History sync failed', err);
+    }finally{
+      delete _syncing[contactId];
+    }
+  }
+
+  window.addEventListener('online', ()=>{ if(currentContact) syncContact(currentContact.id); });
+
+  // Live updates: messages stored for this contact from other tabs or devices
+  function subscribeToContact(contactId){
+    if(eventSource) eventSource.close();
+    eventSource = null;
+    if(!window.EventSource) return;
+    eventSource = new EventSource(`/api/stream/${encodeURIComponent(contactId)}`);
+    // After a dropped connection, catch up on anything missed in one sync
+    let streamLost = false;
+    eventSource.onerror = ()=>{ streamLost = true; };
+    eventSource.onopen = ()=>{ if(streamLost){ streamLost = false; syncContact(contactId); } };
+    eventSource.onmessage = (e)=>{
+      let event;
+      try{ event = JSON.parse(e.data) }catch(err){ return }
+      if(event.client_id === clientId) return;
+      const m = event.message || {};
+      const s = event.sentiment || {};
+      const msg = {
+        id: event.message_id || `event-${event.id}`,
+        text: m.text, time: m.time, date: m.date, iso: m.iso, dir: m.dir || 'sent', synced: true,
+        sentiment: {emoji: s.emoji, category: s.category, description: s.description, color: s.color, polarity: s.polarity_score}
+      };
+      let history = [];
+      try{ const raw = localStorage.getItem(storageKeyFor(contactId)); history = raw ? JSON.parse(raw) : [] }catch(err){ history = [] }
+      // Tabs share localStorage, so the sending tab may have saved it already
+      if(!history.some(h => h.id === msg.id)){
+        history.push(msg);
+        saveHistory(history, contactId);
+      }
+      if(currentContact && currentContact.id === contactId){
+        renderMessage(msg);
+        scrollBottom();
+      }
+    };
+  }
 
   // Open / close chat
   function openChat(){
@@ -303,7 +451,12 @@ document.addEventListener('DOMContentLoaded', () => {
     selectContact(currentContact.id);
     setTimeout(()=> input && input.focus(), 150);
   }
-  function closeChat(){ if(!chatPanel) return; chatPanel.classList.add('hidden'); chatPanel.setAttribute('aria-hidden','true'); }
+  function closeChat(){
+    if(!chatPanel) return;
+    chatPanel.classList.add('hidden');
+    chatPanel.setAttribute('aria-hidden','true');
+    if(eventSource){ eventSource.close(); eventSource = null; }
+  }
 
   if(btn) btn.addEventListener('click', (e)=>{e.preventDefault(); openChat();});
   if(btnSm) btnSm.addEventListener('click', (e)=>{e.preventDefault(); openChat();});
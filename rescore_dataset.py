@@ -0,0 +1,137 @@
+"""
+rescore_dataset.py
+Bulk (re)scoring of a chat CSV through Node 3, and optionally Node 1 (TextBlob).
+
+Streams rows from the input CSV and writes them to the output CSV in batches
+with fresh 'sentiment_polarity' and 'sentiment_category' columns. An existing
+'sentiment_category' is kept as 'previous_category' for comparison.
+Memory use is constant regardless of file size.
+
+Node 2 context follows the live pipeline: each row is biased by the
+prediction for the previous category rescored for the same contact.
+
+Usage:
+  python rescore_dataset.py data/data_trained.csv rescored.csv
+  python rescore_dataset.py data/pragmatic_dataset.csv out.csv --textblob --engine fast --workers 4
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+from itertools import islice, repeat, tee
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core_analysis.node_2 import SentimentPredictorNode
+from core_analysis.node_3 import score_message
+from core_analysis.sentiment_analyzer import iter_emotions, ENGINES
+
+OUTPUT_COLUMNS = ['sentiment_polarity', 'sentiment_category', 'previous_category']
+REPORT_INTERVAL = 2.0  # seconds between progress lines
+
+
+def rescore(input_path, output_path, use_textblob=False, engine=None, workers=1,
+            batch_size=1000, text_column='text', use_node_2=True):
+    """
+    Rescores every row of input_path into output_path.
+
+    Returns:
+        dict: {'rows': int, 'seconds': float, 'rows_per_sec': float}
+    """
+    predictor = None
+    if use_node_2:
+        predictor = SentimentPredictorNode(input_path)
+        predictor.load_and_train()
+    last_category = {}  # contact_id -> last rescored category
+
+    started = time.perf_counter()
+    last_report = started
+    count = 0
+
+    with open(input_path, 'r', newline='', encoding='utf-8') as fin, \
+         open(output_path, 'w', newline='', encoding='utf-8') as fout:
+        reader = csv.DictReader(fin)
+        fieldnames = list(reader.fieldnames or [])
+        if text_column not in fieldnames:
+            raise ValueError(f"Column '{text_column}' not found in {input_path}")
+        for col in OUTPUT_COLUMNS:
+            if col not in fieldnames:
+                fieldnames.append(col)
+        writer = csv.DictWriter(fout, fieldnames=fieldnames)
+        writer.writeheader()
+
+        rows, text_rows = tee(reader)
+        if use_textblob:
+            emotions = iter_emotions((r.get(text_column) or '' for r in text_rows),
+                                     workers=workers, chunk_size=batch_size, engine=engine)
+        else:
+            emotions = repeat(None)
+        scored = zip(rows, emotions)
+
+        while True:
+            batch = list(islice(scored, batch_size))
+            if not batch:
+                break
+            out = []
+            for row, emotion in batch:
+                text = row.get(text_column) or ''
+                contact_id = row.get('contact_id')
+
+                node_1_result = {'polarity': emotion[0]} if emotion else None
+                node_2_result = None
+                if predictor is not None:
+                    prediction, probability = predictor.predict_next(last_category.get(contact_id, 'Neutral'))
+                    node_2_result = {'prediction': prediction, 'probability': probability}
+
+                result = score_message(text, node_1_result, node_2_result)
+                last_category[contact_id] = result['category']
+
+                row['previous_category'] = row.get('sentiment_category', '')
+                row['sentiment_polarity'] = round(result['composite_score'], 3)
+                row['sentiment_category'] = result['category']
+                out.append(row)
+            writer.writerows(out)
+            count += len(out)
+
+            now = time.perf_counter()
+            if now - last_report >= REPORT_INTERVAL:
+                print(f"  {count} rows, {count / (now - started):.0f} rows/sec", file=sys.stderr)
+                last_report = now
+
+    elapsed = time.perf_counter() - started
+    return {
+        'rows': count,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(count / elapsed, 1) if elapsed > 0 else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rescore a chat CSV with the sentiment pipeline')
+    parser.add_argument('input', help='Input CSV (needs a text column)')
+    parser.add_argument('output', help='Output CSV path')
+    parser.add_argument('--textblob', action='store_true', help='Include Node 1 (TextBlob) polarity')
+    parser.add_argument('--engine', choices=ENGINES, default=None, help='Polarity engine for Node 1')
+    parser.add_argument('--workers', type=int, default=1, help='Processes for Node 1 scoring (0 = all cores)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Rows per read/score/write batch')
+    parser.add_argument('--text-column', default='text', help='Name of the message text column')
+    parser.add_argument('--no-node2', action='store_true', help='Skip the Node 2 prediction bias')
+    args = parser.parse_args()
+
+    stats = rescore(
+        args.input, args.output,
+        use_textblob=args.textblob,
+        engine=args.engine,
+        workers=args.workers or None,
+        batch_size=args.batch_size,
+        text_column=args.text_column,
+        use_node_2=not args.no_node2
+    )
+    print(f"Rescored {stats['rows']} rows in {stats['seconds']}s ({stats['rows_per_sec']} rows/sec) -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
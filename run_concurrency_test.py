@@ -0,0 +1,218 @@
+"""
+run_concurrency_test.py
+Stress test for concurrent writes to the chat history CSV and the insight store.
+
+Many threads (and, where flock is available, processes) append messages at
+the same moment; the test then checks that every row was written exactly
+once, intact and in per-writer order, with a single header. Concurrent
+track_interaction calls must not lose interactions or sentiment counts.
+
+All files are written to a temporary directory; the real history is untouched.
+
+Usage:
+  python run_concurrency_test.py
+  python run_concurrency_test.py --threads 32 --messages 200 --processes 4
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ui_io import storage
+from core_analysis.node_3 import UserInsightEngine
+
+# Awkward content on purpose: quotes, commas, newlines and non-ASCII text.
+# Every 7th message is larger than a write buffer, so it takes several writes.
+TEXT_TEMPLATE = 'writer {w} message {i}, "quoted", multi\nline ✓'
+LARGE_PADDING = 'x' * 20000
+
+
+def _text(w, i):
+    text = TEXT_TEMPLATE.format(w=w, i=i)
+    return text + LARGE_PADDING if i % 7 == 3 else text
+
+
+def _write_messages(writer_id, count, barrier=None):
+    contact = {'id': f'c{writer_id % 5}', 'name': f'Writer {writer_id}'}
+    if barrier is not None:
+        barrier.wait()
+    for i in range(count):
+        message = {'dir': 'sent', 'text': _text(writer_id, i),
+                   'sentiment_polarity': 0.5, 'sentiment_category': 'Positive'}
+        if i % 10 == 9:
+            # Mix in batched appends
+            storage.append_messages(contact, [message])
+        else:
+            storage.append_message(contact, message)
+
+
+def _process_writer(csv_path, writer_id, count):
+    storage.CSV_FILE = csv_path
+    _write_messages(writer_id, count)
+
+
+def check_history_file(csv_path, writers, count):
+    """Returns a list of problems found in the CSV (empty when it is intact)."""
+    problems = []
+    with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    if not rows or rows[0] != storage.CSV_HEADER:
+        problems.append('missing or damaged header')
+    body = rows[1:]
+    if any(row == storage.CSV_HEADER for row in body):
+        problems.append('header written more than once')
+
+    seen = {}
+    for n, row in enumerate(body, start=2):
+        if len(row) != len(storage.CSV_HEADER):
+            problems.append(f'row {n} has {len(row)} fields')
+            continue
+        seen.setdefault(row[6], 0)
+        seen[row[6]] += 1
+
+    expected = [_text(w, i) for w in writers for i in range(count)]
+    missing = [t for t in expected if t not in seen]
+    duplicated = [t for t, c in seen.items() if c > 1]
+    if missing:
+        problems.append(f'{len(missing)} rows lost')
+    if duplicated:
+        problems.append(f'{len(duplicated)} rows duplicated')
+    if len(body) != len(expected):
+        problems.append(f'expected {len(expected)} rows, found {len(body)}')
+
+    # Each writer's rows must appear in the order it wrote them
+    order = {}
+    for row in body:
+        if len(row) == len(storage.CSV_HEADER) and row[6].startswith('writer '):
+            w, i = row[6].split(' message ')
+            order.setdefault(w, []).append(int(i.split(',')[0]))
+    if any(indices != sorted(indices) for indices in order.values()):
+        problems.append('rows out of order for a writer')
+    return problems
+
+
+def test_concurrent_csv_appends(threads=16, messages=100, processes=0):
+    original = storage.CSV_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.CSV_FILE = os.path.join(tmp, 'history.csv')
+        try:
+            barrier = threading.Barrier(threads)
+            workers = [threading.Thread(target=_write_messages, args=(w, messages, barrier))
+                       for w in range(threads)]
+            procs = [multiprocessing.Process(target=_process_writer,
+                                             args=(storage.CSV_FILE, threads + p, messages))
+                     for p in range(processes)]
+            for p in procs:
+                p.start()
+            for t in workers:
+                t.start()
+            for t in workers:
+                t.join()
+            for p in procs:
+                p.join()
+
+            problems = check_history_file(storage.CSV_FILE, range(threads + processes), messages)
+
+            # The per-contact index must agree with the file
+            indexed = sum(len(storage.get_history(f'c{c}')) for c in range(5))
+            if indexed != (threads + processes) * messages:
+                problems.append(f'history index returned {indexed} rows')
+        finally:
+            storage.CSV_FILE = original
+    assert not problems, '; '.join(problems)
+
+
+def test_concurrent_insights(threads=16, messages=50):
+    with tempfile.TemporaryDirectory() as tmp:
+        # A fresh store in tmp (and its log beside it), not the app's
+        previous = os.environ.get('SENTIMENT_INSIGHTS_DB')
+        os.environ['SENTIMENT_INSIGHTS_DB'] = os.path.join(tmp, 'insights.json')
+        try:
+            engine = UserInsightEngine()
+        finally:
+            if previous is None:
+                del os.environ['SENTIMENT_INSIGHTS_DB']
+            else:
+                os.environ['SENTIMENT_INSIGHTS_DB'] = previous
+        categories = ['Positive', 'Negative', 'Neutral']
+        barrier = threading.Barrier(threads)
+        done = threading.Event()
+        unreadable = []
+
+        def read_while_writing():
+            # Readers must always see a complete file, never a half-written one
+            while not done.is_set():
+                try:
+                    with open(engine.db_path, 'r') as f:
+                        json.load(f)
+                except FileNotFoundError:
+                    pass
+                except ValueError:
+                    unreadable.append(1)
+
+        reader = threading.Thread(target=read_while_writing)
+        reader.start()
+
+        def track(w):
+            barrier.wait()
+            for i in range(messages):
+                engine.track_interaction(f'w{w} m{i}', categories[i % 3], 0.1, None, 0.2)
+                engine.get_user_impersonation_profile()
+
+        workers = [threading.Thread(target=track, args=(w,)) for w in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        done.set()
+        reader.join()
+
+        total = threads * messages
+        with open(engine.db_path, 'r') as f:
+            saved = json.load(f)
+        problems = []
+        if unreadable:
+            problems.append(f'{len(unreadable)} reads saw a partially written file')
+        if len(engine.insights['interactions']) != total:
+            problems.append(f"{len(engine.insights['interactions'])} interactions in memory, expected {total}")
+        if sum(engine.insights['patterns']['sentiment_counts'].values()) != total:
+            problems.append('sentiment counts lost updates')
+        if len(saved['interactions']) != total:
+            problems.append(f"{len(saved['interactions'])} interactions on disk, expected {total}")
+    assert not problems, '; '.join(problems)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent write stress test')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--messages', type=int, default=100, help='Messages per writer')
+    parser.add_argument('--processes', type=int, default=2 if storage.fcntl else 0,
+                        help='Extra writer processes (needs flock)')
+    args = parser.parse_args()
+
+    failed = False
+    for name, test, kwargs in (
+        ('CSV appends', test_concurrent_csv_appends,
+         {'threads': args.threads, 'messages': args.messages, 'processes': args.processes}),
+        ('Insight store', test_concurrent_insights,
+         {'threads': args.threads, 'messages': max(args.messages // 2, 1)}),
+    ):
+        try:
+            test(**kwargs)
+            print(f'[PASS] {name}')
+        except AssertionError as e:
+            failed = True
+            print(f'[FAIL] {name}: {e}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -33,7 +33,7 @@ def run_demo_step(step_name, user_input, last_sentiment_context, history_context
     node_2_result = run_node_2_analysis(DATASET_PATH, last_sentiment_context)
     print(f"  -> Prediction: {node_2_result['prediction']} (Prob: {node_2_result['probability']:.2f})")
 
-    # 2. Run Node 1 (Placeholder)
+    # 2. Run Node 1 (TextBlob)
     node_1_result = analyze_sentiment_node_1(user_input)
 
     # 3. Run Node 3 (Core Analysis & Decision)
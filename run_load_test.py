@@ -0,0 +1,259 @@
+"""
+run_load_test.py
+Load generator for the chat UI API (ui_io/UI.py).
+
+Replays messages from data/data_trained.csv as N simulated contacts at a
+target request rate, mixing /api/analyze posts with /api/history polls, and
+reports throughput, latency percentiles and error rates as JSON, for
+comparing runs before and after a change.
+
+Without --url the Flask app is started in-process on a free localhost port,
+with the history CSV (a copy of the current one, so Node 2 has data to learn
+from) and the insight store in a temporary directory; the real data files
+are untouched. With --url an already running server is tested instead
+(e.g. `python run.py --asgi`); note that it stores the generated messages.
+
+Requests are sent on a fixed schedule (open loop): latency is measured from
+each request's scheduled time, so a server that falls behind shows up as
+higher latency instead of a silently lower request rate.
+
+Usage:
+  python run_load_test.py
+  python run_load_test.py --rate 100 --duration 30 --contacts 50 --output before.json
+  python run_load_test.py --url http://127.0.0.1:5000 --rate 20
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(ROOT)
+
+DATASET = os.path.join(ROOT, 'data', 'data_trained.csv')
+LIVE_HISTORY = os.path.join(ROOT, 'ui_io', 'chat_history_global.csv')
+PERCENTILES = (50, 90, 95, 99)
+
+
+def load_texts(path=DATASET):
+    """Returns the sent message texts from the dataset."""
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        texts = [row['text'] for row in csv.DictReader(f)
+                 if row.get('dir', 'sent') == 'sent' and row.get('text')]
+    if not texts:
+        raise ValueError(f'No messages found in {path}')
+    return texts
+
+
+def start_local_server(workdir, copy_history=True):
+    """
+    Starts the Flask app on a free localhost port with its data files in
+    `workdir`. Returns (base_url, server).
+    """
+    history = os.path.join(workdir, 'chat_history_global.csv')
+    if copy_history and os.path.exists(LIVE_HISTORY):
+        shutil.copyfile(LIVE_HISTORY, history)
+    # Must be set before the app (and storage / node_3) are imported
+    os.environ['CHAT_HISTORY_CSV'] = history
+    os.environ['SENTIMENT_INSIGHTS_DB'] = os.path.join(workdir, 'user_insights.json')
+
+    from werkzeug.serving import make_server
+    from ui_io.UI import app
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='load-test-server', daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+class Recorder:
+    """Collects per-request outcomes from the worker threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []  # (endpoint, status, latency_seconds, degraded)
+
+    def add(self, endpoint, status, latency, degraded=False):
+        with self._lock:
+            self.samples.append((endpoint, status, latency, degraded))
+
+
+def _request(base_url, endpoint, body, timeout):
+    """Sends one request; returns (status, parsed JSON body or None). Status 0 = no response."""
+    if endpoint == 'analyze':
+        req = urllib.request.Request(
+            base_url + '/api/analyze', data=json.dumps(body).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}, method='POST')
+    else:
+        req = urllib.request.Request(f"{base_url}/api/history/{body['contact_id']}")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read() or b'null')
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code, None
+    except (OSError, ValueError):
+        return 0, None
+
+
+def run_load(base_url, texts, contacts=20, rate=50.0, duration=10.0, history_ratio=0.2,
+             concurrency=64, timeout=30.0, warmup=5, seed=1):
+    """
+    Sends requests to base_url at `rate` per second for `duration` seconds.
+
+    Returns:
+        dict: the report (see summarize)
+    """
+    rng = random.Random(seed)
+    contact_ids = [f'load_{n}' for n in range(contacts)]
+    client_id = f'load-test-{os.getpid()}'
+
+    def analyze_body(i):
+        contact_id = rng.choice(contact_ids)
+        return {'text': rng.choice(texts), 'contact_id': contact_id,
+                'contact_name': contact_id.replace('_', ' ').title(),
+                'client_id': client_id, 'message_id': f'{client_id}-{i}'}
+
+    # Warm-up (not recorded): loads the models and lexicons before timing starts
+    for i in range(warmup):
+        _request(base_url, 'analyze', analyze_body(-1 - i), timeout)
+
+    recorder = Recorder()
+
+    def fire(endpoint, body, scheduled):
+        status, payload = _request(base_url, endpoint, body, timeout)
+        degraded = bool(payload.get('degraded')) if isinstance(payload, dict) else False
+        recorder.add(endpoint, status, time.perf_counter() - scheduled, degraded)
+
+    total = int(rate * duration)
+    interval = 1.0 / rate
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='load')
+    start = time.perf_counter()
+    for i in range(total):
+        scheduled = start + i * interval
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        if rng.random() < history_ratio:
+            pool.submit(fire, 'history', {'contact_id': rng.choice(contact_ids)}, scheduled)
+        else:
+            pool.submit(fire, 'analyze', analyze_body(i), scheduled)
+    pool.shutdown(wait=True)
+    elapsed = time.perf_counter() - start
+
+    report = summarize(recorder.samples, elapsed)
+    report['config'] = {
+        'url': base_url, 'contacts': contacts, 'target_rate': rate, 'duration': duration,
+        'history_ratio': history_ratio, 'concurrency': concurrency, 'timeout': timeout,
+        'warmup': warmup, 'seed': seed
+    }
+    return report
+
+
+def _percentile(sorted_values, p):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    rank = math.ceil(p / 100.0 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def _latency_stats(latencies):
+    values = sorted(latency * 1000.0 for latency in latencies)
+    if not values:
+        return {}
+    stats = {'min': values[0], 'mean': sum(values) / len(values), 'max': values[-1]}
+    for p in PERCENTILES:
+        stats[f'p{p}'] = _percentile(values, p)
+    return {k: round(v, 2) for k, v in stats.items()}
+
+
+def summarize(samples, elapsed):
+    """
+    Builds the report from (endpoint, status, latency, degraded) samples.
+    Statuses outside 2xx/304 (and 0, no response) count as errors.
+    """
+    def block(subset):
+        errors = [s for s in subset if not (200 <= s[1] < 300 or s[1] == 304)]
+        statuses = {}
+        for s in subset:
+            statuses[str(s[1])] = statuses.get(str(s[1]), 0) + 1
+        return {
+            'requests': len(subset),
+            'errors': len(errors),
+            'error_rate': round(len(errors) / len(subset), 4) if subset else 0.0,
+            'throughput_rps': round(len(subset) / elapsed, 2) if elapsed else 0.0,
+            'status_codes': statuses,
+            'latency_ms': _latency_stats([s[2] for s in subset])
+        }
+
+    report = block(samples)
+    report['elapsed_seconds'] = round(elapsed, 3)
+    report['degraded'] = sum(1 for s in samples if s[3])
+    report['endpoints'] = {
+        endpoint: block([s for s in samples if s[0] == endpoint])
+        for endpoint in sorted({s[0] for s in samples})
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test for the chat UI API')
+    parser.add_argument('--url', help='Test a running server instead of starting one in-process')
+    parser.add_argument('--contacts', type=int, default=20, help='Simulated contacts')
+    parser.add_argument('--rate', type=float, default=50.0, help='Target requests per second')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to send requests for')
+    parser.add_argument('--history-ratio', type=float, default=0.2,
+                        help='Fraction of requests that poll /api/history instead of posting a message')
+    parser.add_argument('--concurrency', type=int, default=64, help='Maximum requests in flight')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    parser.add_argument('--warmup', type=int, default=5, help='Unrecorded requests sent first')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--empty-history', action='store_true',
+                        help='In-process mode: start from an empty history instead of a copy')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    texts = load_texts()
+    workdir = None
+    server = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        workdir = tempfile.mkdtemp(prefix='chat-load-')
+        base_url, server = start_local_server(workdir, copy_history=not args.empty_history)
+
+    try:
+        report = run_load(base_url, texts, contacts=args.contacts, rate=args.rate,
+                          duration=args.duration, history_ratio=args.history_ratio,
+                          concurrency=args.concurrency, timeout=args.timeout,
+                          warmup=args.warmup, seed=args.seed)
+    finally:
+        if server is not None:
+            server.shutdown()
+            # Write pending trend state now, while the scratch directory exists
+            from core_analysis.trend import get_trend_tracker
+            get_trend_tracker().flush()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -33,7 +33,7 @@ def main():
     print(f"{COLORS['Neutral']}Initializing Comprehensive Sentiment Analysis System...{COLORS['RESET']}")
     print("-" * 60)
     print("Architecture Loaded:")
-    print(" [ ] Node 1: TextBlob Analysis (Inactive/Placeholder)")
+    print(" [*] Node 1: TextBlob Analysis (Active)")
     print(" [*] Node 2: Data Science Prediction (Active)")
     print(" [*] Node 3: Core Analysis & Decision (Active)")
     print("-" * 60)
@@ -71,7 +71,7 @@ def main():
                 
             node_2_result = run_node_2_analysis(csv_path, last_sentiment)
             
-            # 3. Run Node 1 (Placeholder)
+            # 3. Run Node 1 (TextBlob)
             node_1_result = analyze_sentiment_node_1(user_input)
             
             # 4. Run Node 3 (Core Analysis)
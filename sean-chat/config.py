@@ -6,7 +6,30 @@ DB_PATH = BASE_DIR / "sean.db"
 CONTACTS_JSON = BASE_DIR / "contacts.json"
 MASTER_KEY_FILE = BASE_DIR / "master.key"
 LOG_FILE = BASE_DIR / "sean.log"
+# Encrypted full-text index of message plaintext, used by history search
+SEARCH_INDEX_FILE = BASE_DIR / "search.idx"
+SEARCH_INDEX_SAVE_DELAY = 5.0  # seconds; changes within the delay share one save
 BACKUP_DIR = BASE_DIR / "backups"
+# Backups: newest BACKUP_KEEP are kept (0 keeps all), gzip-compressed when
+# BACKUP_COMPRESS; the online backup copies BACKUP_PAGES DB pages per step.
+# Local-mode chats start a background backup every BACKUP_EVERY sent messages,
+# skipped when nothing changed since the last one.
+BACKUP_KEEP = 10
+BACKUP_COMPRESS = True
+BACKUP_PAGES = 256
+BACKUP_EVERY = 10
+# contacts.json is rewritten at most once per this many seconds
+CONTACTS_JSON_DELAY = 1.0
+
+# Group commit: message writes are batched into one transaction per window
+# (milliseconds) or per this many operations; 0 ms writes each one immediately
+GROUP_COMMIT_MS = 20
+GROUP_COMMIT_OPS = 100
+# Seconds to wait before retrying a failed group commit (its writes are kept)
+GROUP_COMMIT_RETRY_DELAY = 1.0
+
+# Messages shown per page by the `history` and `chat` commands
+HISTORY_PAGE_SIZE = 20
 
 # Server defaults for real-time relay (for local testing)
 SERVER_HOST = "localhost"
@@ -56,15 +56,13 @@ def get_private_key(name: str) -> Optional[bytes]:
 
 
 def backup_contacts_json(path=None):
-    # Contacts JSON is always maintained by storage; just return its path
+    # Contacts JSON is maintained by storage; write any pending changes and return its path
+    storage.flush_contacts_json()
     return CONTACTS_JSON
 
 
 def import_contacts_from_json(path):
     with open(path, "r") as f:
         data = json.load(f)
-    for item in data:
-        name = item.get("name")
-        pub = item.get("public_key")
-        if name and pub:
-            storage.add_contact(name, pub.encode(), None)
+    storage.add_contacts([(item["name"], item["public_key"].encode())
+                          for item in data if item.get("name") and item.get("public_key")])
@@ -5,9 +5,11 @@ Uses `cryptography` package.
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.fernet import Fernet
 import os
 import json
+import base64
 from typing import Tuple
 
 from utils import b64enc, b64dec, sha256_hex, gen_packet_id
@@ -23,6 +25,13 @@ def ensure_master_key() -> bytes:
     return MASTER_KEY_FILE.read_bytes()
 
 
+def derive_fernet_key(purpose: bytes) -> bytes:
+    """Derive a Fernet key for one purpose from the master key (HKDF-SHA256)"""
+    master = base64.urlsafe_b64decode(ensure_master_key())
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"sean:" + purpose)
+    return base64.urlsafe_b64encode(hkdf.derive(master))
+
+
 def generate_rsa_keypair() -> Tuple[bytes, bytes]:
     """Generate RSA 2048 keypair and return (public_pem, private_pem)"""
     key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
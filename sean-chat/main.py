@@ -13,9 +13,11 @@ from pathlib import Path
 
 import websockets
 
-from config import Colors, STATUS_ICONS, LOG_FILE, SERVER_HOST, SERVER_PORT
+from config import (Colors, STATUS_ICONS, LOG_FILE, SERVER_HOST, SERVER_PORT, HISTORY_PAGE_SIZE,
+                    GROUP_COMMIT_MS, GROUP_COMMIT_OPS, BACKUP_EVERY)
 from utils import now_ts, human_size, sanitize_name
 from storage import Storage
+from search_index import SearchIndex
 import contacts as contacts_mod
 import crypto
 
@@ -23,7 +25,9 @@ import crypto
 logging.basicConfig(filename=str(LOG_FILE), level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 logger = logging.getLogger('sean')
 
-storage = Storage()
+storage = Storage(group_commit_ms=GROUP_COMMIT_MS, group_commit_ops=GROUP_COMMIT_OPS)
+# Plaintext search index, kept up to date as messages are sent and received
+search_index = SearchIndex()
 
 # Identity (default 'me'). Will be set from CLI args.
 IDENTITY_NAME = 'me'
@@ -38,6 +42,12 @@ def ensure_my_identity(name: str = 'me'):
 
 # Will be initialized after arg parsing
 
+# Where the last history listing stopped, for `more`: (name, search, oldest id examined)
+_history_cursor = None
+
+# Messages sent since the last automatic backup
+_sent_since_backup = 0
+
 # Rate limiting: 5 messages per minute per contact
 _rate_windows = defaultdict(lambda: deque())
 
@@ -140,6 +150,8 @@ class WSClient:
             try:
                 my_priv = crypto.decrypt_private_pem(storage.get_contact(self.name)[2])
                 pt = crypto.decrypt_packet(packet, my_priv)
+                if packet_id:
+                    search_index.add(packet_id, frm, pt)
             except Exception as e:
                 pt = f"[DECRYPT ERROR: {e}]"
             print_color(f"[{now_ts()}] {frm} → {pt} [🔓DECRYPTED]", Colors.OKBLUE)
@@ -151,9 +163,8 @@ class WSClient:
                 storage.add_contact(name, pub.encode(), None)
                 logger.info('Presence: %s', name)
         elif typ == 'roster':
-            for c in data.get('contacts', []):
-                if c.get('name') and c.get('public_key'):
-                    storage.add_contact(c['name'], c['public_key'].encode(), None)
+            storage.add_contacts([(c['name'], c['public_key'].encode())
+                                  for c in data.get('contacts', []) if c.get('name') and c.get('public_key')])
         elif typ == 'status':
             packet_id = data.get('packet_id')
             status = data.get('status')
@@ -189,7 +200,9 @@ def cmd_help():
   add_contact <name>      - Add contact (auto-generates keys)
   list_contacts           - Show all contacts
   chat <name>             - Start 2-way chat session
-  history <name> [search] - Show chat history (search optional)
+  history <name> [search] - Show recent chat history (search optional)
+  more                    - Show older messages of the last history
+  reindex                 - Add stored messages missing from the search index
   clear_history <name>    - Delete chat history
   delete_contact <name>   - Remove contact + history
   generate_keys           - Regenerate my key pair
@@ -239,28 +252,61 @@ def decrypt_message_for_display(row):
     return pt, state
 
 
-def cmd_history(name: str, search: str = None):
+def cmd_history(name: str, search: str = None, before_id: int = None):
+    """Show one page of history (HISTORY_PAGE_SIZE messages, or search hits) older than before_id.
+
+    Searches go through the search index, so only the hits are decrypted;
+    before_id is then an index id rather than a message id.
+    """
+    global _history_cursor
     row_contact = storage.get_contact(name)
     if not row_contact:
         print_color('Contact not found', Colors.FAIL)
         return
-    rows = storage.get_history(name)
-    # decrypt and filter if search
-    hits = []
-    for r in rows:
+    if search:
+        found = search_index.search(name, search, before_id=before_id, limit=HISTORY_PAGE_SIZE)
+        more = len(found) == HISTORY_PAGE_SIZE
+        cursor = found[-1][0] if found else before_id
+        rows = storage.get_messages([packet_id for _, packet_id in found])
+        hits = [rows[packet_id] for _, packet_id in reversed(found) if packet_id in rows]
+        if not hits and before_id is None and not search_index.count() and storage.count_messages():
+            print_color('Search index is empty; run `reindex` to index stored messages', Colors.WARNING)
+    else:
+        hits = storage.get_history(name, before_id=before_id, limit=HISTORY_PAGE_SIZE)
+        more = len(hits) == HISTORY_PAGE_SIZE
+        cursor = hits[0]['id'] if hits else before_id
+    if not hits and before_id is not None:
+        print('No older messages')
+    for r in hits:
         pt, state = decrypt_message_for_display(r)
-        if search:
-            if search.lower() in pt.lower():
-                hits.append((r, pt, state))
-        else:
-            hits.append((r, pt, state))
-    for r, pt, state in hits:
         ts = r['timestamp'][:16].replace('T', ' ')
         direction = r['direction']
         who = 'You' if direction == 'sent' else name
         size = human_size(r['size_bytes'])
         color = Colors.OKGREEN if direction == 'sent' else Colors.OKBLUE
         print_color(f"[{ts}] {who} → {pt} [{state}][{size}]", color)
+    _history_cursor = (name, search, cursor) if more else None
+    return more
+
+
+def cmd_reindex():
+    """Index stored messages that the search index is missing (decrypts only those)."""
+    def plaintext(row):
+        pt, state = decrypt_message_for_display(row)
+        return None if state == '⚠️ERROR' else pt
+
+    added = 0
+    for c in storage.list_contacts():
+        added += search_index.backfill(storage.get_history(c['name']), plaintext)
+    search_index.save()
+    print_color(f'Search index updated: {added} message(s) added', Colors.OKGREEN)
+
+
+def cmd_more():
+    if not _history_cursor:
+        print('No more history')
+        return
+    cmd_history(*_history_cursor)
 
 
 def cmd_clear_history(name: str):
@@ -268,6 +314,7 @@ def cmd_clear_history(name: str):
         print_color('Contact not found', Colors.FAIL)
         return
     storage.clear_history(name)
+    search_index.remove_contact(name)
     print_color('History cleared', Colors.OKGREEN)
 
 
@@ -276,6 +323,7 @@ def cmd_delete_contact(name: str):
         print_color('Contact not found', Colors.FAIL)
         return
     storage.delete_contact(name)
+    search_index.remove_contact(name)
     print_color('Contact deleted', Colors.OKGREEN)
 
 
@@ -291,16 +339,24 @@ def cmd_backup():
     print_color(f'Backup created: {dest}', Colors.OKGREEN)
 
 
+def _report_backup(future):
+    if future.exception() is not None:
+        print_color(f'Auto-backup failed: {future.exception()}', Colors.FAIL)
+
+
 def cmd_restore(path: str):
     pathp = Path(path)
     if not pathp.exists():
         print_color('Backup file not found', Colors.FAIL)
         return
     storage.restore_db(pathp)
-    print_color('DB restored. Restart may be required.', Colors.WARNING)
+    # The index described the old DB; rebuild it from the restored messages
+    search_index.clear()
+    print_color('DB restored. Restart may be required; run `reindex` to rebuild the search index.', Colors.WARNING)
 
 
 def send_message(to_name: str, message: str):
+    global _sent_since_backup
     contact = storage.get_contact(to_name)
     if not contact:
         print_color('No such contact', Colors.FAIL)
@@ -325,6 +381,7 @@ def send_message(to_name: str, message: str):
     packet_obj = json.loads(packet_json)
     packet_id = packet_obj['packet_id']
     storage.add_message(packet_id, to_name, 'sent', packet_json, time.strftime('%Y-%m-%dT%H:%M:%S'), 'sent', size)
+    search_index.add(packet_id, to_name, message)
     print_color(f"[{now_ts()}] You → {message} [🔒SENT][{human_size(size)}]", Colors.OKGREEN)
 
     # If we are connected to a server, send via real-time relay
@@ -334,9 +391,11 @@ def send_message(to_name: str, message: str):
         # mark delivered/read asynchronously (local simulation)
         mark_delivered_in_background(packet_id)
 
-        # auto-backup every 10 messages
-        if storage.count_messages() % 10 == 0:
-            storage.backup_db()
+        # auto-backup every BACKUP_EVERY messages, without blocking the prompt
+        _sent_since_backup += 1
+        if _sent_since_backup >= BACKUP_EVERY:
+            _sent_since_backup = 0
+            storage.backup_in_background().add_done_callback(_report_backup)
 
         # Simulate friend auto-reply (for demo only)
         def auto_reply():
@@ -351,6 +410,7 @@ def send_message(to_name: str, message: str):
             size2 = len(packet_reply.encode())
             pkt = json.loads(packet_reply)
             storage.add_message(pkt['packet_id'], to_name, 'received', packet_reply, time.strftime('%Y-%m-%dT%H:%M:%S'), 'delivered', size2)
+            search_index.add(pkt['packet_id'], to_name, reply)
             print_color(f"[{now_ts()}] {to_name} → {reply} [🔓DECRYPTED][{human_size(size2)}]", Colors.OKBLUE)
         t = threading.Thread(target=auto_reply, daemon=True)
         t.start()
@@ -363,8 +423,8 @@ def chat_session(name: str):
         return
     print_color(f"=== CHAT WITH {name.upper()} ===", Colors.HEADER)
     # show last few messages
-    cmd_history(name)
-    print("Type 'exit' to end chat...")
+    more = cmd_history(name)
+    print("Type 'exit' to end chat" + (", '/more' for older messages..." if more else "..."))
     while True:
         try:
             msg = input('> ')
@@ -375,6 +435,9 @@ def chat_session(name: str):
             continue
         if msg.strip().lower() == 'exit':
             break
+        if msg.strip().lower() == '/more':
+            cmd_more()
+            continue
         send_message(name, msg)
 
 
@@ -410,6 +473,10 @@ def repl():
                 name = args[0]
                 search = ' '.join(args[1:]) if len(args) > 1 else None
                 cmd_history(name, search)
+        elif cmd == 'more':
+            cmd_more()
+        elif cmd == 'reindex':
+            cmd_reindex()
         elif cmd == 'clear_history':
             if not args:
                 print_color('Specify contact', Colors.FAIL)
@@ -463,4 +530,5 @@ if __name__ == '__main__':
         if ws_client:
             ws_client.stop()
         storage.close()
+        search_index.save()
         print_color('Session saved. Bye!', Colors.WARNING)
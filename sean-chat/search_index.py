@@ -0,0 +1,238 @@
+"""Local full-text index of message plaintext, for history search
+
+Messages are stored encrypted, so searching them used to mean decrypting
+every packet. Instead, each message's plaintext is added here when it is sent
+or received, and a search is one indexed query; only the hits are decrypted
+for display.
+
+The index is an in-memory SQLite DB with an FTS5 table (trigram tokenizer,
+so any substring of 3+ characters is an index lookup). On disk it is an
+append-only log: each save appends one line, the changes since the previous
+save Fernet-encrypted with a key derived from the master key, so saving costs
+O(changes) and no plaintext is written unencrypted. The log is replayed at
+startup and compacted (rewritten from the live index) once removed entries
+outnumber live ones. Saves are debounced like contacts.json.
+
+Messages stored before the index existed (or restored from a backup) are
+added with `backfill`, which decrypts only the ones missing from the index.
+"""
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+import crypto
+from config import SEARCH_INDEX_FILE, SEARCH_INDEX_SAVE_DELAY
+
+logger = logging.getLogger("sean.search")
+
+_KEY_PURPOSE = b"search-index"
+
+
+class SearchIndex:
+    def __init__(self, path: Path = SEARCH_INDEX_FILE, save_delay: float = SEARCH_INDEX_SAVE_DELAY):
+        self.path = path
+        self.save_delay = save_delay
+        self._lock = threading.RLock()
+        self._fernet = None
+        self._save_timer = None
+        self._pending: List[list] = []  # changes not yet in the log: ["add", packet_id, contact, text], ...
+        self._log_adds = 0              # "add" entries in the log file, live or not
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        # Unicode-aware case folding, the same on both sides of a scanned search
+        self.conn.create_function("casefold", 1, lambda t: t.casefold() if t else t, deterministic=True)
+        self.fts = self._init_schema()
+        self._load()
+        atexit.register(self.save)
+
+    def _cipher(self) -> Fernet:
+        if self._fernet is None:
+            self._fernet = Fernet(crypto.derive_fernet_key(_KEY_PURPOSE))
+        return self._fernet
+
+    def _load(self):
+        """Replays the log file into the index."""
+        if not self.path.exists():
+            return
+        cipher = self._cipher()
+        skipped = 0
+        complete = 0  # bytes up to the end of the last complete line
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Cut short by a crash; dropped so the next append starts a fresh line
+                    skipped += 1
+                    break
+                complete += len(line)
+                try:
+                    changes = json.loads(cipher.decrypt(line.strip()))
+                except (InvalidToken, ValueError):
+                    # Wrong master key or damaged entry
+                    skipped += 1
+                    continue
+                self._apply(changes)
+                self._log_adds += sum(1 for change in changes if change[0] == "add")
+        if complete < self.path.stat().st_size:
+            os.truncate(self.path, complete)
+        self.conn.commit()
+        if skipped:
+            logger.warning("Search index %s: %d unreadable entries skipped; `reindex` restores them",
+                           self.path, skipped)
+
+    def _apply(self, changes: List[list]) -> List[list]:
+        """Applies changes to the in-memory index; returns those that changed it."""
+        applied = []
+        for change in changes:
+            if change[0] == "add":
+                _, packet_id, contact, text = change
+                c = self.conn.execute("INSERT OR IGNORE INTO docs (packet_id, contact) VALUES (?, ?)",
+                                      (packet_id, contact))
+                if c.rowcount:
+                    self.conn.execute("INSERT INTO body (rowid, text) VALUES (?, ?)", (c.lastrowid, text))
+                    applied.append(change)
+                continue
+            if change[0] == "remove_contact":
+                self.conn.execute("DELETE FROM body WHERE rowid IN (SELECT id FROM docs WHERE contact=?)",
+                                  (change[1],))
+                self.conn.execute("DELETE FROM docs WHERE contact=?", (change[1],))
+            elif change[0] == "clear":
+                self.conn.execute("DELETE FROM body")
+                self.conn.execute("DELETE FROM docs")
+            applied.append(change)
+        return applied
+
+    def _init_schema(self) -> bool:
+        """Creates the tables; returns whether full-text search is available."""
+        c = self.conn
+        c.execute("CREATE TABLE docs(id INTEGER PRIMARY KEY, packet_id TEXT UNIQUE, contact TEXT)")
+        c.execute("CREATE INDEX idx_docs_contact_id ON docs(contact, id)")
+        try:
+            # rowid = docs.id
+            c.execute("CREATE VIRTUAL TABLE body USING fts5(text, tokenize='trigram')")
+            return True
+        except sqlite3.OperationalError:
+            # SQLite without FTS5 or the trigram tokenizer (< 3.34): plain table, scanned
+            logger.warning("FTS5 trigram tokenizer unavailable; search scans the index")
+            c.execute("CREATE TABLE body(text TEXT)")
+            return False
+
+    # Updates
+    def add(self, packet_id: str, contact: str, text: str):
+        self.add_many([(packet_id, contact, text)])
+
+    def add_many(self, items: Iterable[Tuple[str, str, str]]) -> int:
+        """Indexes (packet_id, contact, plaintext) tuples; already indexed packets are skipped.
+
+        Returns the number of messages added.
+        """
+        return len(self._change([["add", packet_id, contact, text] for packet_id, contact, text in items]))
+
+    def remove_contact(self, contact: str):
+        self._change([["remove_contact", contact]])
+
+    def clear(self):
+        self._change([["clear"]])
+
+    def _change(self, changes: List[list]) -> List[list]:
+        with self._lock:
+            with self.conn:
+                applied = self._apply(changes)
+            if not applied:
+                return applied
+            self._pending.extend(applied)
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(self.save_delay, self.save)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+        return applied
+
+    def backfill(self, rows: Iterable[dict], decrypt: Callable[[dict], Optional[str]]) -> int:
+        """Indexes stored message rows that are not indexed yet.
+
+        decrypt(row) returns the plaintext, or None to leave the row out.
+        Returns the number of messages added.
+        """
+        with self._lock:
+            known = {r[0] for r in self.conn.execute("SELECT packet_id FROM docs")}
+        items = []
+        for row in rows:
+            if row["packet_id"] in known:
+                continue
+            text = decrypt(row)
+            if text is not None:
+                items.append((row["packet_id"], row["contact_name"], text))
+        return self.add_many(items)
+
+    # Queries
+    def search(self, contact: str, query: str, before_id: Optional[int] = None,
+               limit: int = 20) -> List[Tuple[int, str]]:
+        """Newest hits for query (case-insensitive substring) in a contact's messages.
+
+        Returns up to `limit` (index id, packet_id) pairs, newest first; pass
+        the smallest id as `before_id` for the next page.
+        """
+        # The text match drives the query (newest first); docs is looked up per hit
+        sql = "SELECT b.rowid, d.packet_id FROM body b CROSS JOIN docs d ON d.id = b.rowid WHERE "
+        if self.fts and len(query) >= 3:
+            # Quoted as one FTS5 string: a substring match for the trigram tokenizer
+            sql += "b.text MATCH ?"
+            params: list = ['"' + query.replace('"', '""') + '"']
+        else:
+            sql += "instr(casefold(b.text), ?) > 0"
+            params = [query.casefold()]
+        sql += " AND d.contact = ?"
+        params.append(contact)
+        if before_id is not None:
+            sql += " AND b.rowid < ?"
+            params.append(before_id)
+        sql += " ORDER BY b.rowid DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [(r[0], r[1]) for r in self.conn.execute(sql, params)]
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    # Persistence
+    def save(self):
+        """Appends pending changes to the encrypted log now (compacting it when mostly dead)."""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if not self._pending:
+                return
+            changes, self._pending = self._pending, []
+            adds = sum(1 for change in changes if change[0] == "add")
+            live = self.count()
+            try:
+                if self._log_adds + adds > 2 * live + 100:
+                    self._compact(live)
+                else:
+                    line = self._cipher().encrypt(json.dumps(changes).encode())
+                    with open(self.path, "ab") as f:
+                        f.write(line + b"\n")
+                    self._log_adds += adds
+            except BaseException:
+                self._pending[:0] = changes
+                raise
+
+    def _compact(self, live: int):
+        """Rewrites the log as the live index. Caller holds the lock."""
+        rows = self.conn.execute("SELECT d.packet_id, d.contact, b.text FROM docs d JOIN body b ON b.rowid = d.id "
+                                 "ORDER BY d.id").fetchall()
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            for start in range(0, len(rows), 1000):
+                chunk = [["add", *row] for row in rows[start:start + 1000]]
+                f.write(self._cipher().encrypt(json.dumps(chunk).encode()) + b"\n")
+        os.replace(tmp, self.path)
+        self._log_adds = live
+        logger.info("Search index log compacted to %d entries", live)
@@ -14,11 +14,14 @@ from typing import Dict, Optional, Tuple, List
 import websockets
 
 from storage import Storage
+from config import GROUP_COMMIT_MS, GROUP_COMMIT_OPS
 
 logger = logging.getLogger('sean.server')
 logging.basicConfig(level=logging.INFO)
 
-STORAGE = Storage()
+# Relaying stores each packet and then its delivery status; group commit
+# writes both (and other packets relayed meanwhile) in one transaction
+STORAGE = Storage(group_commit_ms=GROUP_COMMIT_MS, group_commit_ops=GROUP_COMMIT_OPS)
 CONNECTED: Dict[str, object] = {}
 
 
@@ -1,24 +1,268 @@
-"""SQLite storage layer for messages and contacts"""
+"""SQLite storage layer for messages and contacts
+
+The DB runs in WAL mode with synchronous=NORMAL. All writes go through one
+connection, serialized by a lock; each thread reads through its own
+connection, so reads never wait for a write in progress and no cursor is
+shared between threads.
+
+Writes can be grouped into one transaction (one commit) in two ways:
+- `with storage.transaction():` runs every write inside it as a unit of work.
+- Group-commit mode (group_commit_ms > 0): add_message and
+  update_message_status are queued and written by a background thread in one
+  transaction per window (or as soon as group_commit_ops are queued). Status
+  changes of a queued message are folded into it, so a burst such as
+  sent -> delivered -> read writes only the final state. Other writes commit
+  the queue first, in a transaction of its own; a failed group commit puts
+  the writes back in the queue. A read flushes the queue (taking the write
+  lock) only when the reading thread has queued writes not yet committed, so
+  callers see their own writes and other readers never wait for the writer.
+
+Backups use the SQLite online backup API and can run on a background thread
+(backup_in_background), so they never hold the write lock.
+"""
+import atexit
 import sqlite3
 from pathlib import Path
 import json
 from typing import Optional, List, Dict, Any
 from datetime import datetime
+from contextlib import contextmanager
+from concurrent.futures import Future
+import gzip
 import shutil
 import logging
+import os
+import threading
+import time
+import weakref
+
+from config import (DB_PATH, BACKUP_DIR, CONTACTS_JSON, CONTACTS_JSON_DELAY,
+                    BACKUP_KEEP, BACKUP_COMPRESS, BACKUP_PAGES, GROUP_COMMIT_RETRY_DELAY)
+
+# Keeps created_date, and the private key when the new row has none (e.g. a
+# roster entry for a contact whose keys were generated locally)
+_UPSERT_CONTACT = (
+    "INSERT INTO contacts (name, public_key, private_key_encrypted, created_date, last_seen) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(name) DO UPDATE SET public_key=excluded.public_key, "
+    "private_key_encrypted=COALESCE(excluded.private_key_encrypted, contacts.private_key_encrypted), "
+    "last_seen=excluded.last_seen"
+)
 
-from config import DB_PATH, BACKUP_DIR, CONTACTS_JSON
+_INSERT_MESSAGE = ("INSERT INTO messages (packet_id, contact_name, direction, encrypted_packet, timestamp, status, size_bytes) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?)")
 
 logger = logging.getLogger("sean.storage")
 
+# Schema migrations, applied in order; PRAGMA user_version records how many have run
+MIGRATIONS = [
+    # 1: history reads filter by contact and page by id
+    ["CREATE INDEX IF NOT EXISTS idx_messages_contact_id ON messages(contact_name, id)"],
+]
+
 
 class Storage:
-    def __init__(self, db_path: Path = DB_PATH):
+    def __init__(self, db_path: Path = DB_PATH, group_commit_ms: float = 0, group_commit_ops: int = 100):
         self.db_path = db_path
-        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+        self._write_lock = threading.RLock()
+        self._tx_depth = 0  # nesting of transaction() in the thread holding the write lock
+        self._tx_thread = None
+        self._local = threading.local()
+        self._readers = []  # (weakref to owning thread, connection)
+        self._readers_lock = threading.Lock()
+        self._generation = 0  # bumped by restore_db so threads reopen their readers
+        self.conn = self._connect()  # the writer
         self._init_db()
 
+        # Group commit
+        self.group_commit_window = group_commit_ms / 1000.0
+        self.group_commit_ops = max(1, group_commit_ops)
+        self._queue = threading.Condition()
+        self._queued_messages: Dict[str, list] = {}  # packet_id -> insert parameters
+        self._queued_status: Dict[str, str] = {}     # packet_id -> latest status
+        self._queued_ops = 0
+        self._queued_since = 0.0
+        self._queued_seq = 0     # number of writes ever queued
+        self._committed_seq = 0  # _queued_seq as of the last successful group commit
+        self._flusher = None
+        if self.group_commit_window > 0:
+            atexit.register(self.flush)
+
+        # contacts.json mirror, rewritten at most once per CONTACTS_JSON_DELAY
+        self._contacts_json_lock = threading.Lock()
+        self._contacts_json_timer = None
+        self._contacts_json_dirty = False
+        self._contacts_json_write_lock = threading.Lock()
+        self._tx_contacts_changed = False  # contacts changed in the current outermost transaction
+        atexit.register(self.flush_contacts_json)
+
+        # Backups
+        self._backup_lock = threading.Lock()         # one backup (or restore) at a time
+        self._backup_future_lock = threading.Lock()  # guards _backup_future
+        self._backup_future: Optional[Future] = None
+        self._backup_thread = None
+        self._backup_signature = None  # _db_signature() of the last backup
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """This thread's read connection, opened on first use.
+
+        After restore_db bumps the generation, each thread closes and reopens
+        its own connection on its next read; no thread closes a connection
+        another live thread may be using.
+        """
+        local = self._local
+        with self._readers_lock:
+            generation = self._generation
+        if getattr(local, "generation", None) != generation:
+            old = getattr(local, "conn", None)
+            conn = self._connect()
+            with self._readers_lock:
+                # Close connections of threads that have exited
+                live = []
+                for ref, other in self._readers:
+                    thread = ref()
+                    if other is old:
+                        continue
+                    if thread is None or not thread.is_alive():
+                        other.close()
+                    else:
+                        live.append((ref, other))
+                live.append((weakref.ref(threading.current_thread()), conn))
+                self._readers = live
+            if old is not None:
+                old.close()
+            local.conn = conn
+            local.generation = generation
+        return local.conn
+
+    @contextmanager
+    def transaction(self):
+        """Unit of work: all writes inside commit together, or roll back on error.
+
+        Nested calls (including the write methods) join the outer transaction.
+        Queued group-commit writes are committed first, in their own
+        transaction, so a failing unit of work never rolls them back.
+        """
+        with self._write_lock:
+            if self._tx_depth:
+                self._tx_depth += 1
+                try:
+                    yield self.conn
+                finally:
+                    self._tx_depth -= 1
+                return
+            self._commit_queued()
+            self._tx_depth = 1
+            self._tx_thread = threading.get_ident()
+            self._tx_contacts_changed = False
+            try:
+                with self.conn:
+                    yield self.conn
+            finally:
+                self._tx_depth = 0
+                self._tx_thread = None
+                contacts_changed, self._tx_contacts_changed = self._tx_contacts_changed, False
+        # Outside the write lock, once the contact changes are committed (or rolled back)
+        if contacts_changed:
+            self._contacts_changed()
+
+    def _in_transaction(self) -> bool:
+        return self._tx_thread == threading.get_ident()
+
+    # Group commit
+    def _enqueue(self, apply):
+        """Runs apply() (which updates the queue) under the queue lock and wakes the flusher."""
+        with self._queue:
+            if not self._queued_ops:
+                self._queued_since = time.monotonic()
+            apply()
+            self._queued_ops += 1
+            self._queued_seq += 1
+            self._local.queued_seq = self._queued_seq
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="storage-group-commit", daemon=True)
+                self._flusher.start()
+            self._queue.notify()
+
+    def _flush_loop(self):
+        while True:
+            with self._queue:
+                while not self._queued_ops:
+                    self._queue.wait()
+                deadline = self._queued_since + self.group_commit_window
+                while 0 < self._queued_ops < self.group_commit_ops:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._queue.wait(remaining)
+            try:
+                self.flush()
+            except Exception:
+                # The batch is back in the queue; retry after a pause
+                logger.exception("Group commit failed; %d write(s) kept for retry", self._queued_ops)
+                time.sleep(GROUP_COMMIT_RETRY_DELAY)
+
+    def _commit_queued(self):
+        """Commits queued messages and status changes in one transaction.
+
+        Caller holds the write lock and is not inside a transaction. If the
+        commit fails, the writes go back into the queue and the error is raised.
+        """
+        with self._queue:
+            messages, statuses = self._queued_messages, self._queued_status
+            if not messages and not statuses:
+                return
+            seq, ops = self._queued_seq, self._queued_ops
+            self._queued_messages, self._queued_status, self._queued_ops = {}, {}, 0
+        try:
+            with self.conn:
+                if messages:
+                    c = self.conn.executemany(_INSERT_MESSAGE.replace("INSERT", "INSERT OR IGNORE", 1),
+                                              list(messages.values()))
+                    if c.rowcount < len(messages):
+                        logger.warning("%d duplicate packet_id(s) skipped", len(messages) - c.rowcount)
+                if statuses:
+                    self.conn.executemany("UPDATE messages SET status=? WHERE packet_id=?",
+                                          [(status, packet_id) for packet_id, status in statuses.items()])
+        except BaseException:
+            with self._queue:
+                # Writes queued meanwhile are newer and win
+                messages.update(self._queued_messages)
+                statuses.update(self._queued_status)
+                if not self._queued_ops:
+                    self._queued_since = time.monotonic()
+                self._queued_messages, self._queued_status = messages, statuses
+                self._queued_ops += ops
+            raise
+        with self._queue:
+            self._committed_seq = max(self._committed_seq, seq)
+
+    def flush(self):
+        """Commits queued group-commit writes now; raises if the commit fails.
+
+        Inside a transaction this does nothing: the queue was committed when
+        the transaction started.
+        """
+        if self._queued_ops:
+            with self._write_lock:
+                if not self._in_transaction():
+                    self._commit_queued()
+
+    def _flush_own(self):
+        """Commits the queue only if this thread has writes in it not yet committed.
+
+        Reads call this so they see their own writes; threads with nothing
+        queued do not take the write lock.
+        """
+        if getattr(self._local, "queued_seq", 0) > self._committed_seq:
+            self.flush()
+
     def _init_db(self):
         c = self.conn.cursor()
         c.execute(
@@ -47,43 +291,91 @@ class Storage:
             """
         )
         self.conn.commit()
+        self._migrate()
         BACKUP_DIR.mkdir(parents=True, exist_ok=True)
         if not CONTACTS_JSON.exists():
             CONTACTS_JSON.write_text("[]")
 
+    def _migrate(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            with self.conn:
+                for sql in statements:
+                    self.conn.execute(sql)
+                self.conn.execute(f"PRAGMA user_version = {number}")
+            logger.info("DB schema migrated to version %d", number)
+
     # Contacts
     def add_contact(self, name: str, public_key: bytes, private_key_encrypted: Optional[bytes] = None):
+        self.add_contacts([(name, public_key, private_key_encrypted)])
+
+    def add_contacts(self, contacts: List[tuple]):
+        """Inserts or updates many contacts in one statement and one transaction.
+
+        contacts: (name, public_key) or (name, public_key, private_key_encrypted)
+        tuples. Existing contacts keep their created_date, and their private key
+        unless a new one is given.
+        """
         now = datetime.utcnow().isoformat()
-        c = self.conn.cursor()
-        c.execute(
-            "INSERT OR REPLACE INTO contacts (name, public_key, private_key_encrypted, created_date, last_seen) VALUES (?, ?, ?, ?, ?)",
-            (name, public_key, private_key_encrypted, now, now),
-        )
-        self.conn.commit()
-        self._sync_contacts_json()
+        rows = [(c[0], c[1], c[2] if len(c) > 2 else None, now, now) for c in contacts]
+        if not rows:
+            return
+        with self.transaction() as conn:
+            conn.executemany(_UPSERT_CONTACT, rows)
+        self._contacts_changed()
 
     def get_contact(self, name: str) -> Optional[sqlite3.Row]:
-        c = self.conn.cursor()
+        c = self._reader().cursor()
         c.execute("SELECT * FROM contacts WHERE name=?", (name,))
         return c.fetchone()
 
     def list_contacts(self) -> List[sqlite3.Row]:
-        c = self.conn.cursor()
+        c = self._reader().cursor()
         c.execute("SELECT * FROM contacts")
         return c.fetchall()
 
     def delete_contact(self, name: str):
-        c = self.conn.cursor()
-        c.execute("DELETE FROM contacts WHERE name=?", (name,))
-        c.execute("DELETE FROM messages WHERE contact_name=?", (name,))
-        self.conn.commit()
-        self._sync_contacts_json()
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM contacts WHERE name=?", (name,))
+            conn.execute("DELETE FROM messages WHERE contact_name=?", (name,))
+        self._contacts_changed()
+
+    def _contacts_changed(self):
+        """Schedules a contacts.json rewrite; changes within the delay share one write.
+
+        Inside a transaction, deferred until the outermost one has exited.
+        """
+        if self._in_transaction():
+            self._tx_contacts_changed = True
+            return
+        with self._contacts_json_lock:
+            self._contacts_json_dirty = True
+            if self._contacts_json_timer is None:
+                self._contacts_json_timer = threading.Timer(CONTACTS_JSON_DELAY, self.flush_contacts_json)
+                self._contacts_json_timer.daemon = True
+                self._contacts_json_timer.start()
+
+    def flush_contacts_json(self):
+        """Writes pending contact changes to contacts.json now.
 
-    def _sync_contacts_json(self):
+        Never takes the write lock: the contacts are read through this
+        thread's reader, and _contacts_json_write_lock only orders the file
+        writes, so a newer snapshot is never overwritten by an older one.
+        """
+        with self._contacts_json_write_lock:
+            with self._contacts_json_lock:
+                if self._contacts_json_timer is not None:
+                    self._contacts_json_timer.cancel()
+                    self._contacts_json_timer = None
+                if not self._contacts_json_dirty:
+                    return
+                self._contacts_json_dirty = False
+            rows = self._reader().execute("SELECT name, public_key, created_date, last_seen FROM contacts").fetchall()
+            self._write_contacts_json(rows)
+
+    @staticmethod
+    def _write_contacts_json(rows):
         # dump public keys for backup
-        c = self.conn.cursor()
-        c.execute("SELECT name, public_key, created_date, last_seen FROM contacts")
-        rows = c.fetchall()
         arr = []
         for r in rows:
             arr.append({
@@ -92,60 +384,240 @@ class Storage:
                 "created_date": r[2],
                 "last_seen": r[3],
             })
-        CONTACTS_JSON.write_text(json.dumps(arr, indent=2))
+        tmp = CONTACTS_JSON.with_name(CONTACTS_JSON.name + ".tmp")
+        tmp.write_text(json.dumps(arr, indent=2))
+        os.replace(tmp, CONTACTS_JSON)
 
     # Messages
     def add_message(self, packet_id: str, contact_name: str, direction: str, encrypted_packet: str, timestamp: str, status: str, size_bytes: int):
-        c = self.conn.cursor()
+        params = [packet_id, contact_name, direction, encrypted_packet, timestamp, status, size_bytes]
+        if self.group_commit_window > 0 and not self._in_transaction():
+            def apply():
+                if packet_id in self._queued_messages:
+                    logger.warning("Duplicate packet_id %s skipped", packet_id)
+                else:
+                    self._queued_messages[packet_id] = params
+            self._enqueue(apply)
+            return
         try:
-            c.execute(
-                "INSERT INTO messages (packet_id, contact_name, direction, encrypted_packet, timestamp, status, size_bytes) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (packet_id, contact_name, direction, encrypted_packet, timestamp, status, size_bytes),
-            )
-            self.conn.commit()
+            with self.transaction() as conn:
+                conn.execute(_INSERT_MESSAGE, params)
         except sqlite3.IntegrityError:
             logger.warning("Duplicate packet_id %s skipped", packet_id)
 
-    def get_history(self, contact_name: str, search: Optional[str] = None) -> List[Dict[str, Any]]:
-        c = self.conn.cursor()
+    def get_history(self, contact_name: str, search: Optional[str] = None,
+                    before_id: Optional[int] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Messages with a contact, oldest first.
+
+        With `limit`, returns only the newest `limit` messages older than
+        `before_id` (keyset pagination: pass the smallest id of one page as
+        `before_id` to get the page before it).
+        """
+        sql = "SELECT * FROM messages WHERE contact_name=?"
+        params: list = [contact_name]
         if search:
-            q = f"%{search}%"
-            c.execute("SELECT * FROM messages WHERE contact_name=? AND encrypted_packet LIKE ? ORDER BY id", (contact_name, q))
+            sql += " AND encrypted_packet LIKE ?"
+            params.append(f"%{search}%")
+        if before_id is not None:
+            sql += " AND id < ?"
+            params.append(before_id)
+        if limit is None:
+            sql += " ORDER BY id"
         else:
-            c.execute("SELECT * FROM messages WHERE contact_name=? ORDER BY id", (contact_name,))
-        rows = c.fetchall()
-        return [dict(r) for r in rows]
+            sql += " ORDER BY id DESC LIMIT ?"
+            params.append(limit)
+        self._flush_own()
+        c = self._reader().cursor()
+        c.execute(sql, params)
+        rows = [dict(r) for r in c.fetchall()]
+        if limit is not None:
+            rows.reverse()
+        return rows
+
+    def get_messages(self, packet_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Messages by packet_id (ids with no stored message are left out)."""
+        if not packet_ids:
+            return {}
+        self._flush_own()
+        c = self._reader().cursor()
+        c.execute(f"SELECT * FROM messages WHERE packet_id IN ({','.join('?' * len(packet_ids))})", packet_ids)
+        return {r["packet_id"]: dict(r) for r in c.fetchall()}
 
     def clear_history(self, contact_name: str):
-        c = self.conn.cursor()
-        c.execute("DELETE FROM messages WHERE contact_name=?", (contact_name,))
-        self.conn.commit()
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM messages WHERE contact_name=?", (contact_name,))
 
     def count_messages(self) -> int:
-        c = self.conn.cursor()
+        self._flush_own()
+        c = self._reader().cursor()
         c.execute("SELECT COUNT(*) FROM messages")
         return c.fetchone()[0]
 
     def update_message_status(self, packet_id: str, status: str):
-        c = self.conn.cursor()
-        c.execute("UPDATE messages SET status=? WHERE packet_id=?", (status, packet_id))
-        self.conn.commit()
+        if self.group_commit_window > 0 and not self._in_transaction():
+            def apply():
+                queued = self._queued_messages.get(packet_id)
+                if queued is not None:
+                    queued[5] = status  # not written yet: store the final status directly
+                else:
+                    self._queued_status[packet_id] = status
+            self._enqueue(apply)
+            return
+        with self.transaction() as conn:
+            conn.execute("UPDATE messages SET status=? WHERE packet_id=?", (status, packet_id))
 
-    def backup_db(self):
-        stamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-        dest = BACKUP_DIR / f"sean_{stamp}.db"
-        self.conn.commit()
-        shutil.copyfile(self.db_path, dest)
+    # Backups
+    def backup_db(self, compress: bool = BACKUP_COMPRESS, incremental: bool = False) -> Optional[Path]:
+        """Writes a consistent copy of the DB to BACKUP_DIR and returns its path.
+
+        Uses the SQLite online backup API from a separate connection, copying
+        BACKUP_PAGES pages per step, so writers are not blocked while it runs.
+        With `incremental`, returns None without writing anything when the DB
+        has not changed since the last backup. Only the newest BACKUP_KEEP
+        backups are kept.
+        """
+        self.flush_contacts_json()
+        self.flush()
+        with self._backup_lock:
+            signature = self._db_signature()
+            if incremental and signature == self._backup_signature:
+                logger.debug("DB unchanged since last backup, skipped")
+                return None
+            stamp = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+            dest = BACKUP_DIR / (f"sean_{stamp}.db" + (".gz" if compress else ""))
+            raw = BACKUP_DIR / f"sean_{stamp}.db.part"
+            packed = BACKUP_DIR / f"sean_{stamp}.db.gz.part"
+            try:
+                src = sqlite3.connect(str(self.db_path), timeout=10)
+                try:
+                    dst = sqlite3.connect(str(raw))
+                    try:
+                        src.backup(dst, pages=BACKUP_PAGES)
+                    finally:
+                        dst.close()
+                finally:
+                    src.close()
+                if compress:
+                    with open(raw, "rb") as fin, gzip.open(packed, "wb") as fout:
+                        shutil.copyfileobj(fin, fout)
+                    os.remove(raw)
+                    os.replace(packed, dest)
+                else:
+                    os.replace(raw, dest)
+            except BaseException:
+                for leftover in (raw, packed):
+                    try:
+                        os.remove(leftover)
+                    except FileNotFoundError:
+                        pass
+                raise
+            self._backup_signature = signature
+            self._prune_backups()
         logger.info("DB backup created: %s", dest)
         return dest
 
+    def backup_in_background(self, compress: bool = BACKUP_COMPRESS, incremental: bool = True) -> Future:
+        """Starts backup_db on a background thread; the future gets its result.
+
+        If a background backup is already running, returns its future instead
+        of starting another.
+        """
+        with self._backup_future_lock:
+            if self._backup_future is not None and not self._backup_future.done():
+                return self._backup_future
+            future = self._backup_future = Future()
+
+        def run():
+            try:
+                future.set_result(self.backup_db(compress=compress, incremental=incremental))
+            except Exception as e:
+                logger.exception("Background backup failed")
+                future.set_exception(e)
+
+        self._backup_thread = threading.Thread(target=run, name="storage-backup", daemon=True)
+        self._backup_thread.start()
+        return future
+
+    def _db_signature(self):
+        """Size and mtime of the DB and its WAL; any committed write changes one of them."""
+        signature = []
+        for path in (str(self.db_path), f"{self.db_path}-wal"):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    @staticmethod
+    def _prune_backups():
+        backups = [p for p in BACKUP_DIR.glob("sean_*.db*") if p.name.endswith((".db", ".db.gz"))]
+        backups.sort(key=lambda p: p.stat().st_mtime)
+        for old in backups[:-BACKUP_KEEP] if BACKUP_KEEP > 0 else []:
+            try:
+                old.unlink()
+                logger.info("Old backup removed: %s", old)
+            except OSError:
+                logger.warning("Could not remove old backup %s", old)
+
     def restore_db(self, path: Path):
-        self.conn.close()
-        shutil.copyfile(path, self.db_path)
-        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+        """Replaces the DB with a backup (plain or gzip-compressed).
+
+        The backup is staged next to the DB and renamed over it, so readers
+        still open on the old DB keep a consistent view of it until they
+        reopen on their next read.
+        """
+        path = Path(path)
+        staged = Path(f"{self.db_path}.restore")
+        if path.suffix == ".gz":
+            with gzip.open(path, "rb") as fin, open(staged, "wb") as fout:
+                shutil.copyfileobj(fin, fout)
+        else:
+            shutil.copyfile(path, staged)
+        try:
+            with self._backup_lock, self._write_lock:
+                self._close_writer()
+                # A leftover WAL from the old DB must not be applied to the restored one
+                for suffix in ("-wal", "-shm"):
+                    try:
+                        os.remove(f"{self.db_path}{suffix}")
+                    except FileNotFoundError:
+                        pass
+                os.replace(staged, self.db_path)
+                self.conn = self._connect()
+                self._migrate()
+                self._backup_signature = None
+                with self._readers_lock:
+                    self._generation += 1
+        finally:
+            if staged.exists():
+                os.remove(staged)
         logger.info("DB restored from %s", path)
 
-    def close(self):
+    def _close_writer(self):
+        """Commits queued writes and closes the writer. Caller holds the write lock."""
+        self.flush()
         self.conn.commit()
         self.conn.close()
+
+    def close(self):
+        """Closes the writer and the read connections of this and exited threads.
+
+        Other live threads' readers are left to them (closed when the thread
+        calls _reader again or its connection is garbage collected).
+        """
+        if self._backup_thread is not None:
+            self._backup_thread.join()
+        self.flush_contacts_json()
+        with self._write_lock:
+            self._close_writer()
+        with self._readers_lock:
+            self._generation += 1
+            live = []
+            for ref, conn in self._readers:
+                thread = ref()
+                if thread is None or not thread.is_alive() or thread is threading.current_thread():
+                    conn.close()
+                else:
+                    live.append((ref, conn))
+            self._readers = live
@@ -6,50 +6,206 @@ Features:
 - Serves frontend files (HTML, CSS, JS)
 - Provides API endpoint for sentiment analysis
 - Integrates with chat_service for message processing and storage
+- Streams newly stored messages per contact (Server-Sent Events)
+- Reconciles the browser's local history in one request (/api/sync)
 
 Run:
   pip install flask textblob
   python UI.py
 
+Set SENTIMENT_WARMUP=1 to load the analysis pipeline (including TextBlob)
+at start-up, e.g. before a pre-forking server spawns its workers.
+
+Set SENTIMENT_BATCH_WINDOW_MS (e.g. 5) to coalesce concurrent /api/analyze
+requests arriving within that many milliseconds into one batch
+(SENTIMENT_BATCH_MAX caps the batch size, default 64).
+
+Under load, requests beyond SENTIMENT_MAX_IN_FLIGHT concurrent analyses
+(default 32, or twice SENTIMENT_BATCH_MAX with batching on), or arriving
+while the average analysis time exceeds SENTIMENT_LATENCY_BUDGET_MS (default
+off), get a cheaper context-only analysis and "degraded": true in the
+response.
+
 Access in browser: http://127.0.0.1:5000/
 """
 import os
 import sys
 import json
-from flask import Flask, send_from_directory, abort, request, jsonify
+import time
+from flask import Flask, Response, abort, request, jsonify, g
 
 # Add parent directory to path to find other modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core_analysis.chat_service import process_user_message, get_history
+from ui_io.storage import get_history_since, get_history_version, set_rows_scanned_observer
+from core_analysis.events import get_broker
+from ui_io.static_assets import static_response, reload_manifest, get_manifest
+from core_analysis.metrics import counter, histogram, render as render_metrics
+
+STREAM_KEEPALIVE = 15  # seconds between keep-alive comments on idle streams
+MAX_SYNC_MESSAGES = 500  # per /api/sync request
+
+HTTP_REQUESTS = counter('http_requests_total', 'HTTP requests handled', ('route', 'method', 'status'))
+HTTP_LATENCY = histogram('http_request_duration_seconds', 'Time to produce the response (stream bodies excluded)', ('route',))
+HISTORY_ROWS_SCANNED = counter('history_rows_scanned_total', 'History CSV rows parsed by reads', ('source',))
+set_rows_scanned_observer(lambda source, count: HISTORY_ROWS_SCANNED.inc(count, labels=(source,)))
+
+
+def record_request(route, method, status, seconds):
+    """Records one handled request; shared with the ASGI app."""
+    HTTP_REQUESTS.inc(labels=(route, method, str(status)))
+    HTTP_LATENCY.observe(seconds, labels=(route,))
 
-APP_ROOT = os.path.dirname(os.path.abspath(__file__))
-PROJECT_ROOT = os.path.dirname(APP_ROOT)
-INTERFACE_JS_DIR = os.path.join(PROJECT_ROOT, 'interface_js')
+
+def _chat_service():
+    """
+    Imports the analysis pipeline on first use, so starting the server (or
+    importing this module in tests) does not load Node 1/2/3 and their data.
+    """
+    from core_analysis import chat_service
+    return chat_service
+
+
+# Optional pre-fork warm-up: load the pipeline and its state at import time
+# instead of during the first request
+if os.environ.get('SENTIMENT_WARMUP', '0') == '1':
+    _chat_service().warm_up()
 
 # Disable default static file handling to allow custom routing for interface_js
 app = Flask(__name__, static_folder=None)
 
+# Read, hash and compress the static assets once, at start-up
+get_manifest()
+
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        record_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+
+# Static file routes (served from the in-memory manifest, see static_assets.py)
+def _serve_static(filename):
+    if app.debug:
+        # Pick up edited pages/scripts without restarting the dev server
+        reload_manifest(if_changed=True)
+    status, headers, body = static_response(
+        filename,
+        accept_encoding=request.headers.get('Accept-Encoding'),
+        if_none_match=request.headers.get('If-None-Match'),
+        version=request.args.get('v')
+    )
+    if status == 404:
+        abort(404)
+    return Response(body, status=status, headers=headers)
+
 
-# Static file routes
 @app.route('/')
 def index():
-    return send_from_directory(APP_ROOT, 'index.html')
+    return _serve_static('index.html')
 
 
 @app.route('/<path:filename>')
 def static_files(filename):
-    # Check ui_io folder
-    file_path = os.path.join(APP_ROOT, filename)
-    if os.path.exists(file_path):
-        return send_from_directory(APP_ROOT, filename)
-    
-    # Check interface_js folder (for script.js)
-    js_path = os.path.join(INTERFACE_JS_DIR, filename)
-    if os.path.exists(js_path):
-        return send_from_directory(INTERFACE_JS_DIR, filename)
+    return _serve_static(filename)
+
+
+# Request handlers, shared by the Flask routes below and the ASGI app (asgi.py).
+# Each takes plain values and returns (payload_dict, status_code); handle_history
+# also returns the response headers.
+def handle_analyze(data):
+    try:
+        if not isinstance(data, dict):
+            return {"success": False, "error": "Invalid JSON body"}, 400
+        text = data.get('text', '').strip()
+        contact_id = data.get('contact_id', 'unknown')
+        contact_name = data.get('contact_name', 'User')
         
-    abort(404)
+        if not text:
+            return {"success": False, "error": "Empty message"}, 400
+        
+        contact = {'id': contact_id, 'name': contact_name}
+        result = _chat_service().submit_user_message(
+            text, contact,
+            client_id=data.get('client_id'),
+            message_id=data.get('message_id')
+        )
+        
+        return {
+            "success": True,
+            "message": result['message'],
+            "sentiment": {
+                "category": result['sentiment']['category'],
+                "emoji": result['sentiment']['emoji'],
+                "description": result['sentiment']['description'],
+                "polarity": result['sentiment']['polarity_score'],
+                "color": result['sentiment']['color']
+            },
+            "trend": result['trend'],
+            "degraded": result.get('degraded', False)
+        }, 200
+        
+    except Exception as e:
+        return {"success": False, "error": str(e)}, 500
+
+
+def handle_history(contact_id, since=None, if_none_match=None):
+    """
+    since: cursor from a previous response; only newer messages are returned.
+    if_none_match: the client's If-None-Match header; unchanged history gets a
+    304 with no payload, without reading any messages.
+    """
+    try:
+        since = int(since) if since not in (None, '') else 0
+    except ValueError:
+        return {"success": False, "error": "Invalid cursor"}, 400, {}
+    try:
+        cursor, version = get_history_version(contact_id)
+        etag = f'"{version}-{since}"'
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+            return None, 304, headers
+        messages, cursor = get_history_since(contact_id, since)
+        return {"success": True, "messages": messages, "cursor": cursor}, 200, headers
+    except Exception as e:
+        return {"success": False, "error": str(e)}, 500, {}
+
+
+def handle_sync(data):
+    try:
+        if not isinstance(data, dict) or not isinstance(data.get('messages', []), list):
+            return {"success": False, "error": "Invalid JSON body"}, 400
+        contact_id = data.get('contact_id')
+        if not contact_id:
+            return {"success": False, "error": "Missing contact_id"}, 400
+        messages = [m for m in data.get('messages', []) if isinstance(m, dict)]
+        if len(messages) > MAX_SYNC_MESSAGES:
+            return {"success": False, "error": f"At most {MAX_SYNC_MESSAGES} messages per sync"}, 413
+        try:
+            since = int(data.get('since') or 0)
+        except (TypeError, ValueError):
+            return {"success": False, "error": "Invalid cursor"}, 400
+        
+        contact = {'id': contact_id, 'name': data.get('contact_name', 'User')}
+        result = _chat_service().sync_client_messages(
+            contact, messages, since=since, client_id=data.get('client_id')
+        )
+        return dict(success=True, **result), 200
+    except Exception as e:
+        return {"success": False, "error": str(e)}, 500
+
+
+def format_sse(event):
+    """Formats a broker event as a Server-Sent Events message."""
+    return f"id: {event['id']}\ndata: {json.dumps(event)}\n\n"
 
 
 # API Routes
@@ -70,36 +226,12 @@ def analyze_message():
         "success": true,
         "message": {...},
         "sentiment": {...},
-        "trend": "improving|declining|stable"
+        "trend": "improving|declining|stable",
+        "degraded": false
     }
     """
-    try:
-        data = request.get_json()
-        text = data.get('text', '').strip()
-        contact_id = data.get('contact_id', 'unknown')
-        contact_name = data.get('contact_name', 'User')
-        
-        if not text:
-            return jsonify({"success": False, "error": "Empty message"}), 400
-        
-        contact = {'id': contact_id, 'name': contact_name}
-        result = process_user_message(text, contact)
-        
-        return jsonify({
-            "success": True,
-            "message": result['message'],
-            "sentiment": {
-                "category": result['sentiment']['category'],
-                "emoji": result['sentiment']['emoji'],
-                "description": result['sentiment']['description'],
-                "polarity": result['sentiment']['polarity_score'],
-                "color": result['sentiment']['color']
-            },
-            "trend": result['trend']
-        }), 200
-        
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    payload, status = handle_analyze(request.get_json(silent=True))
+    return jsonify(payload), status
 
 
 @app.route('/api/history/<contact_id>', methods=['GET'])
@@ -107,17 +239,92 @@ def get_chat_history(contact_id):
     """
     Endpoint to retrieve chat history for a contact.
     
+    Query: ?since=<cursor> returns only messages after that cursor.
+    Sends an ETag; a matching If-None-Match gets 304 Not Modified.
+    
     Response JSON:
     {
         "success": true,
-        "messages": [...]
+        "messages": [...],
+        "cursor": 42
     }
     """
-    try:
-        messages = get_history(contact_id)
-        return jsonify({"success": True, "messages": messages}), 200
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    payload, status, headers = handle_history(
+        contact_id,
+        since=request.args.get('since'),
+        if_none_match=request.headers.get('If-None-Match')
+    )
+    if payload is None:
+        return '', status, headers
+    return jsonify(payload), status, headers
+
+
+@app.route('/api/sync', methods=['POST'])
+def sync_history():
+    """
+    Reconciles a client's local history in one round-trip: stores the
+    messages the server has not seen (deduplicated by message id, so
+    retries are safe) in one write, and returns the contact's messages
+    stored since the client's cursor.
+    
+    Request JSON:
+    {
+        "contact_id": "contact_id",
+        "contact_name": "contact_name",
+        "client_id": "...",
+        "since": 42,
+        "messages": [{"id": "...", "text": "...", "dir": "sent", "iso": "...",
+                      "date": "...", "time": "...", "sentiment": {...}}, ...]
+    }
+    
+    Response JSON:
+    {
+        "success": true,
+        "stored": ["<id>", ...],
+        "duplicates": ["<id>", ...],
+        "sentiments": {"<id>": {...}},
+        "messages": [...],
+        "cursor": 57
+    }
+    """
+    payload, status = handle_sync(request.get_json(silent=True))
+    return jsonify(payload), status
+
+
+@app.route('/api/stream/<contact_id>', methods=['GET'])
+def stream_messages(contact_id):
+    """
+    Server-Sent Events stream of messages stored for a contact, pushed as
+    they are analyzed. Each event's data is JSON:
+    {
+        "id": 7,
+        "contact_id": "...",
+        "client_id": "...",
+        "message_id": "...",
+        "message": {...},
+        "sentiment": {...},
+        "trend": "improving|declining|stable"
+    }
+    """
+    subscription = get_broker().subscribe(contact_id)
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while not subscription.closed:
+                event = subscription.get(timeout=STREAM_KEEPALIVE)
+                yield format_sse(event) if event else ": keep-alive\n\n"
+        finally:
+            subscription.close()
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint (text exposition format)."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 
 if __name__ == '__main__':
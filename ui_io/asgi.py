@@ -0,0 +1,294 @@
+"""
+asgi.py
+Async (ASGI) serving mode for the chat UI.
+
+Serves the same /api/analyze, /api/sync and /api/history/<contact_id> contract as UI.py,
+but from an event loop. Blocking work (CSV reads and appends, Node 2
+training, insight persistence) runs on a bounded pool of ASGI_WORKERS
+threads, and at most ASGI_MAX_PENDING requests may wait for it. Requests
+beyond that get an immediate 503 instead of queueing without limit, so idle
+or slow clients never tie up a worker.
+
+/api/stream/<contact_id> (Server-Sent Events) is served natively on the
+event loop, so an open stream costs no worker thread.
+
+Static files are answered straight from the in-memory asset manifest
+(static_assets.py). Any other path goes to the Flask app from UI.py through a
+small WSGI bridge on the same pool.
+
+Run:
+  pip install -r docs/requirements.txt   (includes uvicorn)
+  uvicorn ui_io.asgi:app --port 5000
+  (or: python run.py --asgi)
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+# Add parent directory to path to find other modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core_analysis.events import get_broker
+from core_analysis.metrics import render as render_metrics
+from ui_io.static_assets import static_response
+from ui_io.UI import (app as flask_app, handle_analyze, handle_history, handle_sync, format_sse,
+                      record_request, STREAM_KEEPALIVE)
+
+ASGI_WORKERS = int(os.environ.get('ASGI_WORKERS', '8'))
+ASGI_MAX_PENDING = int(os.environ.get('ASGI_MAX_PENDING', '256'))
+MAX_BODY_BYTES = 1024 * 1024
+
+_executor = ThreadPoolExecutor(max_workers=ASGI_WORKERS, thread_name_prefix='asgi-worker')
+_slots = None  # asyncio.Semaphore, created on the running loop
+
+
+class _Busy(Exception):
+    pass
+
+
+async def _offload(func, *args):
+    """Runs a blocking call on the worker pool, rejecting it if the queue is full."""
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(ASGI_MAX_PENDING)
+    if _slots.locked():
+        raise _Busy()
+    async with _slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, func, *args)
+
+
+def _header(scope, name):
+    values = [v.decode('latin-1') for k, v in scope.get('headers', []) if k.lower() == name]
+    return ', '.join(values) or None
+
+
+async def _read_body(receive):
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body = message.get('body', b'')
+        size += len(body)
+        if size > MAX_BODY_BYTES:
+            raise ValueError('Request body too large')
+        chunks.append(body)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _send_response(send, status, headers, body, head=False):
+    headers = list(headers) + [(b'content-length', str(len(body)).encode('latin-1'))]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b'' if head else body})
+
+
+async def _send_json(send, payload, status, headers=()):
+    body = json.dumps(payload).encode('utf-8')
+    await _send_response(send, status, [(b'content-type', b'application/json')] + list(headers), body)
+
+
+def _call_wsgi(scope, body):
+    """Runs one request through the Flask app (blocking; called on the worker pool)."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        key = 'HTTP_' + name
+        environ[key] = environ[key] + ',' + value if key in environ else value
+
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+
+    result = flask_app(environ, start_response)
+    try:
+        content = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    headers = [(k.lower().encode('latin-1'), v.encode('latin-1'))
+               for k, v in response['headers'] if k.lower() != 'content-length']
+    return response['status'], headers, content
+
+
+async def _stream(contact_id, receive, send):
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    subscription = get_broker().subscribe(contact_id, notify=lambda: loop.call_soon_threadsafe(wake.set))
+
+    async def wait_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    disconnected = asyncio.ensure_future(wait_disconnect())
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+        while not disconnected.done():
+            woken = asyncio.ensure_future(wake.wait())
+            await asyncio.wait([woken, disconnected], timeout=STREAM_KEEPALIVE,
+                               return_when=asyncio.FIRST_COMPLETED)
+            woken.cancel()
+            wake.clear()
+            if disconnected.done():
+                break
+            chunk = ''.join(format_sse(event) for event in subscription.drain()) or ': keep-alive\n\n'
+            await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+    except OSError:
+        pass  # Client went away mid-write
+    finally:
+        disconnected.cancel()
+        subscription.close()
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            _executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def _match(path, method):
+    """
+    Returns (route, argument) for requests served natively, using the same
+    route names as the Flask rules; (None, None) for requests passed to Flask.
+    """
+    for prefix, route in (('/api/history/', '/api/history/<contact_id>'),
+                          ('/api/stream/', '/api/stream/<contact_id>')):
+        if path.startswith(prefix) and method == 'GET':
+            argument = path[len(prefix):]
+            return (route, argument) if '/' not in argument else (None, None)
+    if path in ('/api/analyze', '/api/sync') and method == 'POST':
+        return path, None
+    if path == '/metrics' and method == 'GET':
+        return '/metrics', None
+    if method in ('GET', 'HEAD') and not path.startswith('/api/'):
+        name = path.lstrip('/')
+        return ('/<path:filename>', name) if name else ('/', 'index.html')
+    return None, None
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    method = scope['method']
+    route, argument = _match(scope['path'], method)
+    if route is None:
+        # Everything else via Flask (which records its own request metrics)
+        try:
+            body = await _read_body(receive)
+            if body is None:
+                return
+            status, headers, content = await _offload(_call_wsgi, scope, body)
+            await _send_response(send, status, headers, content)
+        except _Busy:
+            await _send_busy(send)
+        return
+
+    started = time.perf_counter()
+    raw_send = send
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            record_request(route, method, message['status'], time.perf_counter() - started)
+        await raw_send(message)
+
+    try:
+        if route in ('/api/analyze', '/api/sync'):
+            try:
+                body = await _read_body(receive)
+            except ValueError as e:
+                await _send_json(send, {"success": False, "error": str(e)}, 413)
+                return
+            if body is None:
+                return
+            try:
+                data = json.loads(body) if body else None
+            except ValueError:
+                data = None
+            handler = handle_analyze if route == '/api/analyze' else handle_sync
+            payload, status = await _offload(handler, data)
+            await _send_json(send, payload, status)
+
+        elif route == '/api/history/<contact_id>':
+            query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+            payload, status, headers = await _offload(
+                handle_history, argument,
+                query.get('since', [None])[0], _header(scope, b'if-none-match')
+            )
+            headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers.items()]
+            if payload is None:
+                await _send_response(send, status, headers, b'')
+            else:
+                await _send_json(send, payload, status, headers)
+
+        elif route == '/api/stream/<contact_id>':
+            await _stream(argument, receive, send)
+
+        elif route == '/metrics':
+            await _send_response(send, 200, [(b'content-type', b'text/plain; version=0.0.4; charset=utf-8')],
+                                 render_metrics().encode('utf-8'))
+
+        else:
+            query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+            status, headers, content = static_response(
+                argument,
+                accept_encoding=_header(scope, b'accept-encoding'),
+                if_none_match=_header(scope, b'if-none-match'),
+                version=query.get('v', [None])[0]
+            )
+            headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers.items()]
+            await _send_response(send, status, headers, content, head=method == 'HEAD')
+    except _Busy:
+        await _send_busy(send)
+
+
+async def _send_busy(send):
+    await _send_json(send, {"success": False, "error": "Server busy, retry shortly"}, 503,
+                     [(b'retry-after', b'1')])
@@ -0,0 +1,211 @@
+"""
+static_assets.py
+Startup-time manifest of the chat UI's static files.
+
+Every servable file under ui_io/ and interface_js/ is read once: its bytes,
+content type, a sha256-based ETag and precomputed gzip (and brotli, if the
+`brotli` package is installed) bodies are kept in memory. Requests are then
+answered from the manifest with no filesystem access.
+
+Only whitelisted extensions are served, so source files, the history CSV and
+other runtime state next to the pages are never exposed.
+
+Caching:
+- HTML pages are served with 'no-cache' (always revalidated by ETag), and
+  their references to other assets are rewritten to '<asset>?v=<hash>'.
+- A request carrying the asset's current ?v= hash is 'immutable' for a year.
+- Other asset requests (e.g. avatars set from script.js) are revalidated.
+"""
+
+import gzip
+import hashlib
+import os
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(APP_ROOT)
+INTERFACE_JS_DIR = os.path.join(PROJECT_ROOT, 'interface_js')
+
+# Searched in order; the first directory containing a path wins
+STATIC_DIRS = [APP_ROOT, INTERFACE_JS_DIR]
+
+CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+    '.svg': 'image/svg+xml',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.ico': 'image/x-icon',
+    '.webp': 'image/webp',
+    '.woff2': 'font/woff2',
+}
+COMPRESSIBLE = {'.html', '.css', '.js', '.svg'}
+MIN_COMPRESS_SIZE = 256
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+_REFERENCE_RE = re.compile(r'((?:src|href)=")([^"?#:]+)(")')
+
+
+class Asset:
+    def __init__(self, name, path, body):
+        self.name = name
+        self.path = path
+        self.ext = os.path.splitext(name)[1].lower()
+        self.content_type = CONTENT_TYPES[self.ext]
+        self.is_page = self.ext == '.html'
+        self.mtime = os.path.getmtime(path)
+        self.set_body(body)
+
+    def set_body(self, body):
+        self.body = body
+        self.version = hashlib.sha256(body).hexdigest()[:16]
+        self.etag = f'"{self.version}"'
+        self.encodings = {}
+        if self.ext in COMPRESSIBLE and len(body) >= MIN_COMPRESS_SIZE:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.encodings['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body)
+                if len(compressed) < len(body):
+                    self.encodings['br'] = compressed
+
+
+def build_manifest():
+    """
+    Scans STATIC_DIRS for servable files.
+
+    Returns:
+        dict: URL path relative to the site root (e.g. 'assets/LOGO.png') -> Asset
+    """
+    manifest = {}
+    for root_dir in STATIC_DIRS:
+        for dirpath, dirnames, filenames in os.walk(root_dir):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith(('.', '__')))
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1].lower() not in CONTENT_TYPES:
+                    continue
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, root_dir).replace(os.sep, '/')
+                if name in manifest:
+                    continue
+                with open(path, 'rb') as f:
+                    manifest[name] = Asset(name, path, f.read())
+
+    # Fingerprint asset references in pages (after every asset is hashed)
+    for asset in manifest.values():
+        if asset.is_page:
+            asset.set_body(_fingerprint(asset.body.decode('utf-8'), manifest).encode('utf-8'))
+    return manifest
+
+
+def _fingerprint(html, manifest):
+    def replace(match):
+        target = manifest.get(match.group(2).lstrip('/'))
+        if target is None or target.is_page:
+            return match.group(0)
+        return f'{match.group(1)}{match.group(2)}?v={target.version}{match.group(3)}'
+    return _REFERENCE_RE.sub(replace, html)
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_manifest():
+    """Returns the shared manifest, built on first use."""
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                _manifest = build_manifest()
+    return _manifest
+
+
+def reload_manifest(if_changed=False):
+    """
+    Rebuilds the manifest from disk. With if_changed=True it is only rebuilt
+    when a known file was modified or removed (used by the debug server).
+    """
+    global _manifest
+    with _manifest_lock:
+        if if_changed and _manifest is not None and not _is_stale(_manifest):
+            return _manifest
+        _manifest = build_manifest()
+        return _manifest
+
+
+def _is_stale(manifest):
+    for asset in manifest.values():
+        try:
+            if os.path.getmtime(asset.path) != asset.mtime:
+                return True
+        except OSError:
+            return True
+    return False
+
+
+def _accepted_encodings(accept_encoding):
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        token, _, params = part.strip().partition(';')
+        if params.replace(' ', '').lower() in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        if token:
+            accepted.add(token.strip().lower())
+    return accepted
+
+
+def _etag_matches(etag, if_none_match):
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == '*' or tag == etag:
+            return True
+    return False
+
+
+def static_response(name, accept_encoding=None, if_none_match=None, version=None):
+    """
+    Builds the response for a static file.
+
+    Args:
+        name: path relative to the site root, e.g. 'index.html'
+        accept_encoding / if_none_match: the request's header values
+        version: the request's ?v= query value, if any
+
+    Returns:
+        tuple: (status, headers_dict, body_bytes)
+    """
+    asset = get_manifest().get(name)
+    if asset is None:
+        return 404, {'Content-Type': 'text/plain; charset=utf-8'}, b'Not Found'
+
+    if not asset.is_page and version == asset.version:
+        cache_control = IMMUTABLE_CACHE
+    else:
+        cache_control = REVALIDATE_CACHE
+    headers = {'ETag': asset.etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+
+    if if_none_match and _etag_matches(asset.etag, if_none_match):
+        return 304, headers, b''
+
+    headers['Content-Type'] = asset.content_type
+    accepted = _accepted_encodings(accept_encoding)
+    for encoding in ('br', 'gzip'):
+        if encoding in asset.encodings and encoding in accepted:
+            headers['Content-Encoding'] = encoding
+            return 200, headers, asset.encodings[encoding]
+    return 200, headers, asset.body
@@ -4,26 +4,149 @@ A simple CSV-backed storage module to append and read chat messages with sentime
 Functions:
 - append_message(contact, message): append single message with optional sentiment data
 - append_messages(contact, messages): append list of message dicts to CSV
+- append_rows(entries): append (contact, message) pairs for several contacts at once
 - get_history(contact_id): return list of messages for contact_id
+- get_history_since(contact_id, since): messages after a cursor, plus the new cursor
+- get_history_version(contact_id): (cursor, etag) without reading any messages
+- has_message_ids(ids) / sync_messages(contact, messages, since): idempotent client sync by message_id
 - get_csv_path(): return path to csv file
 - get_all_messages_for_analysis(): get all messages for sentiment context analysis
+- load_trends() / save_trends(trends): per-contact sentiment trend state (JSON sidecar)
 This module is importable and can be used by other Python modules/devices.
 """
 import csv
+import io
+import json
 import os
+import shutil
+import threading
+from array import array
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
+
 ROOT = os.path.dirname(os.path.abspath(__file__))
-CSV_FILE = os.path.join(ROOT, 'chat_history_global.csv')
+# CHAT_HISTORY_CSV points the app at another history file (e.g. a load test's
+# scratch copy); the trend state is kept next to it
+CSV_FILE = os.environ.get('CHAT_HISTORY_CSV') or os.path.join(ROOT, 'chat_history_global.csv')
+TRENDS_FILE = os.path.join(os.path.dirname(os.path.abspath(CSV_FILE)), 'chat_trends.json')
+
+# Called as observer(source, count) with the rows parsed by each history read,
+# by how they were read: 'index' (new rows indexed), 'contact' (a contact's
+# rows fetched by offset), 'full_scan'. Set by the app (UI.py wires it to a
+# metrics counter), so this module does not depend on the analysis layer.
+_rows_scanned_observer = None
+
+
+def set_rows_scanned_observer(observer):
+    """Registers the callable told how many CSV rows each history read parsed."""
+    global _rows_scanned_observer
+    _rows_scanned_observer = observer
+
 
-CSV_HEADER = ['contact_id','contact_name','dir','iso_time','date','time','text','sentiment_polarity','sentiment_category','sentiment_emoji','color_hex','saved_at']
+def _rows_scanned(source, count):
+    observer = _rows_scanned_observer
+    if observer is not None:
+        observer(source, count)
+
+_write_lock = threading.Lock()
+
+CSV_HEADER = ['contact_id','contact_name','dir','iso_time','date','time','text','sentiment_polarity','sentiment_category','sentiment_emoji','color_hex','saved_at','message_id']
+# Header written before message ids were stored; upgraded on the next write
+LEGACY_CSV_HEADER = CSV_HEADER[:-1]
+
+_checked_file = None  # (st_dev, st_ino) of the CSV whose header is known to be current
 
 
 def _ensure_header():
-    if not os.path.exists(CSV_FILE):
-        with open(CSV_FILE, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(CSV_HEADER)
+    _write_rows([])
+
+
+def _write_rows(rows, keep=None):
+    """
+    Appends rows to the CSV as a single write, adding the header first if the
+    file is new or empty. Writers are serialized by a process-wide lock and,
+    where available, an exclusive flock so other processes cannot interleave.
+    
+    keep: optional function called with the rows while the file is locked;
+    only the rows it returns are written (used to deduplicate atomically).
+    Returns the rows written.
+    """
+    global _checked_file
+    with _write_lock:
+        while True:
+            with open(CSV_FILE, 'a', newline='', encoding='utf-8') as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    st = os.fstat(f.fileno())
+                    try:
+                        current = os.stat(CSV_FILE)
+                    except OSError:
+                        current = None
+                    if current is None or (current.st_dev, current.st_ino) != (st.st_dev, st.st_ino):
+                        continue  # Replaced (e.g. upgraded) by another process; reopen
+                    f.seek(0, os.SEEK_END)
+                    if f.tell() == 0:
+                        csv.writer(f).writerow(CSV_HEADER)
+                    elif _checked_file != (st.st_dev, st.st_ino):
+                        if _read_header() == LEGACY_CSV_HEADER:
+                            if fcntl is None:
+                                f.close()  # Windows cannot replace an open file
+                            _upgrade_header()
+                            continue
+                        _checked_file = (st.st_dev, st.st_ino)
+                    if keep is not None:
+                        rows = keep(rows)
+                    buf = io.StringIO()
+                    csv.writer(buf).writerows(rows)
+                    f.write(buf.getvalue())
+                    f.flush()
+                    return rows
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _read_header():
+    with open(CSV_FILE, 'r', newline='', encoding='utf-8') as f:
+        return next(csv.reader(f), None)
+
+
+def _upgrade_header():
+    """
+    Rewrites a CSV that still has LEGACY_CSV_HEADER with the current header
+    (older rows simply have no message_id). The file is replaced atomically,
+    so readers see either version. Caller holds the write locks.
+    """
+    tmp_path = CSV_FILE + '.tmp'
+    with open(CSV_FILE, 'r', newline='', encoding='utf-8') as src:
+        src.readline()
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as dst:
+            csv.writer(dst).writerow(CSV_HEADER)
+            shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, CSV_FILE)
+
+
+def _message_row(contact, message):
+    return [
+        contact.get('id'),
+        contact.get('name'),
+        message.get('dir'),
+        message.get('iso') or '',
+        message.get('date') or '',
+        message.get('time') or '',
+        message.get('text') or '',
+        message.get('sentiment_polarity') or '',
+        message.get('sentiment_category') or '',
+        message.get('sentiment_emoji') or '',
+        message.get('color_hex') or '',
+        datetime.utcnow().isoformat(),
+        message.get('message_id') or ''
+    ]
 
 
 def append_message(contact, message):
@@ -31,67 +154,198 @@ def append_message(contact, message):
     contact: dict with keys 'id' and optional 'name'
     message: dict with keys 'dir','iso','date','time','text', and optional sentiment data
     """
-    _ensure_header()
-    with open(CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            contact.get('id'),
-            contact.get('name'),
-            message.get('dir'),
-            message.get('iso') or '',
-            message.get('date') or '',
-            message.get('time') or '',
-            message.get('text') or '',
-            message.get('sentiment_polarity') or '',
-            message.get('sentiment_category') or '',
-            message.get('sentiment_emoji') or '',
-            message.get('color_hex') or '',
-            datetime.utcnow().isoformat()
-        ])
+    _write_rows([_message_row(contact, message)])
 
 
 def append_messages(contact, messages):
-    _ensure_header()
-    with open(CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        for m in messages:
-            writer.writerow([
-                contact.get('id'),
-                contact.get('name'),
-                m.get('dir'),
-                m.get('iso') or '',
-                m.get('date') or '',
-                m.get('time') or '',
-                m.get('text') or '',
-                m.get('sentiment_polarity') or '',
-                m.get('sentiment_category') or '',
-                m.get('sentiment_emoji') or '',
-                m.get('color_hex') or '',
-                datetime.utcnow().isoformat()
-            ])
+    _write_rows([_message_row(contact, m) for m in messages])
+
+
+def append_rows(entries):
+    """Append (contact, message) pairs, possibly for different contacts, in one write."""
+    _write_rows([_message_row(contact, m) for contact, m in entries])
+
+
+class _HistoryIndex:
+    """
+    Byte offsets of each contact's rows in the (append-only) history CSV.
+
+    refresh() only parses what was appended since the last call, so looking up
+    a contact's messages, row count or last offset never rescans the file. The
+    index is rebuilt if the file is replaced or shrinks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset(None)
+        self.generation = 0
+
+    def _reset(self, file_id):
+        self.file_id = file_id
+        self.end = 0          # byte offset up to which the file is indexed
+        self.header = None
+        self.offsets = {}     # contact_id -> array of row start offsets
+        self.message_ids = set()
+        self._id_column = None
+
+    def refresh(self):
+        """Indexes rows appended since the last call. Caller holds self._lock."""
+        try:
+            st = os.stat(CSV_FILE)
+        except OSError:
+            if self.file_id is not None:
+                self._reset(None)
+                self.generation += 1
+            return
+        file_id = (st.st_dev, st.st_ino)
+        if file_id != self.file_id or st.st_size < self.end:
+            self._reset(file_id)
+            self.generation += 1
+        if st.st_size == self.end:
+            return
+
+        scanned = 0
+        with open(CSV_FILE, 'rb') as f:
+            f.seek(self.end)
+            while True:
+                start = f.tell()
+                record = f.readline()
+                # A quoted field may span lines: keep reading until quotes balance
+                while record.count(b'"') % 2 and record.endswith(b'\n'):
+                    more = f.readline()
+                    if not more:
+                        break
+                    record += more
+                if not record.endswith(b'\n') or record.count(b'"') % 2:
+                    break  # Partially written row; pick it up next time
+                self.end = f.tell()
+                row = next(csv.reader([record.decode('utf-8')]), None)
+                if not row:
+                    continue
+                scanned += 1
+                if self.header is None:
+                    self.header = row
+                    if 'message_id' in row:
+                        self._id_column = row.index('message_id')
+                    continue
+                self.offsets.setdefault(row[0], array('q')).append(start)
+                if self._id_column is not None and len(row) > self._id_column and row[self._id_column]:
+                    self.message_ids.add(row[self._id_column])
+        _rows_scanned('index', scanned)
+
+    def read_rows(self, offsets):
+        """Returns the CSV rows (as dicts) starting at the given offsets."""
+        rows = []
+        if not offsets:
+            return rows
+        with open(CSV_FILE, 'r', newline='', encoding='utf-8') as f:
+            for offset in offsets:
+                f.seek(offset)
+                rows.append(next(csv.DictReader(f, fieldnames=self.header)))
+        _rows_scanned('contact', len(rows))
+        return rows
+
+
+_history_index = _HistoryIndex()
+
+
+def _row_to_message(row):
+    return {
+        'dir': row.get('dir'),
+        'iso': row.get('iso_time'),
+        'date': row.get('date'),
+        'time': row.get('time'),
+        'text': row.get('text'),
+        'sentiment_polarity': row.get('sentiment_polarity') or None,
+        'sentiment_category': row.get('sentiment_category') or None,
+        'sentiment_emoji': row.get('sentiment_emoji') or None,
+        'color_hex': row.get('color_hex') or None,
+        'message_id': row.get('message_id') or None
+    }
 
 
 def get_history(contact_id):
     """Return list of messages for contact_id (ordered by file order)."""
-    if not os.path.exists(CSV_FILE):
-        return []
-    out = []
-    with open(CSV_FILE, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row.get('contact_id') == str(contact_id):
-                out.append({
-                    'dir': row.get('dir'),
-                    'iso': row.get('iso_time'),
-                    'date': row.get('date'),
-                    'time': row.get('time'),
-                    'text': row.get('text'),
-                    'sentiment_polarity': row.get('sentiment_polarity') or None,
-                    'sentiment_category': row.get('sentiment_category') or None,
-                    'sentiment_emoji': row.get('sentiment_emoji') or None,
-                    'color_hex': row.get('color_hex') or None
-                })
-    return out
+    return get_history_since(contact_id)[0]
+
+
+def get_history_since(contact_id, since=0):
+    """
+    Return (messages, cursor): the contact's messages after the first `since`
+    ones, and the cursor to pass next time. A cursor beyond the contact's
+    message count (e.g. after the file was replaced) returns everything.
+    """
+    index = _history_index
+    with index._lock:
+        index.refresh()
+        offsets = index.offsets.get(str(contact_id), ())
+        cursor = len(offsets)
+        if since is None or since < 0 or since > cursor:
+            since = 0
+        rows = index.read_rows(offsets[since:])
+    return [_row_to_message(row) for row in rows], cursor
+
+
+def get_history_version(contact_id):
+    """
+    Return (cursor, etag) for contact_id's history without reading messages.
+    The etag changes whenever a message is appended for the contact or the
+    file is replaced.
+    """
+    index = _history_index
+    with index._lock:
+        index.refresh()
+        offsets = index.offsets.get(str(contact_id), ())
+        cursor = len(offsets)
+        last_offset = offsets[-1] if cursor else 0
+        return cursor, f"{index.generation}-{cursor}-{last_offset}"
+
+
+def has_message_ids(message_ids):
+    """Return the subset of message_ids already stored."""
+    index = _history_index
+    with index._lock:
+        index.refresh()
+        return {m for m in message_ids if m in index.message_ids}
+
+
+def sync_messages(contact, messages, since=0):
+    """
+    Stores a client's messages idempotently and returns what it is missing.
+    
+    Messages (dicts as for append_message, each with a 'message_id') whose id
+    is already in the history, or repeated in the batch, are skipped; the rest
+    are appended in one write. The check and the write happen under the write
+    lock, so concurrent or retried syncs never store a message twice.
+    
+    Returns (stored, messages_since, cursor): the message dicts written, the
+    contact's messages after cursor `since` that were not in this batch, and
+    the new cursor.
+    """
+    index = _history_index
+    batch_ids = {m.get('message_id') for m in messages}
+
+    def keep(rows):
+        # message_id is the last column
+        kept = []
+        in_batch = set()
+        with index._lock:
+            index.refresh()
+            for row in rows:
+                if row[-1] not in index.message_ids and row[-1] not in in_batch:
+                    in_batch.add(row[-1])
+                    kept.append(row)
+        return kept
+
+    rows = [_message_row(contact, m) for m in messages if m.get('message_id')]
+    written = {row[-1] for row in _write_rows(rows, keep=keep)} if rows else set()
+    stored = []
+    for m in messages:
+        if m.get('message_id') in written:
+            written.discard(m['message_id'])
+            stored.append(m)
+    newer, cursor = get_history_since(contact.get('id'), since)
+    return stored, [m for m in newer if m.get('message_id') not in batch_ids], cursor
 
 
 def get_all_messages_for_analysis():
@@ -99,14 +353,51 @@ def get_all_messages_for_analysis():
     if not os.path.exists(CSV_FILE):
         return []
     messages = []
+    scanned = 0
     with open(CSV_FILE, 'r', newline='', encoding='utf-8') as f:
         reader = csv.DictReader(f)
         for row in reader:
+            scanned += 1
             if row.get('text'):
                 messages.append(row.get('text'))
+    _rows_scanned('full_scan', scanned)
     return messages
 
 
+def iter_scored_messages():
+    """Yield (contact_id, polarity) for every 'sent' message with a stored polarity."""
+    if not os.path.exists(CSV_FILE):
+        return
+    with open(CSV_FILE, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            if row.get('dir') != 'sent' or not row.get('sentiment_polarity'):
+                continue
+            try:
+                yield row.get('contact_id'), float(row['sentiment_polarity'])
+            except ValueError:
+                continue
+
+
+def load_trends():
+    """Return the saved trend state dict, or None if none has been saved yet."""
+    if not os.path.exists(TRENDS_FILE):
+        return None
+    try:
+        with open(TRENDS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_trends(trends):
+    """Atomically replace the trend state file."""
+    tmp_path = TRENDS_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(trends, f)
+    os.replace(tmp_path, TRENDS_FILE)
+
+
 def get_csv_path():
     return CSV_FILE
 